@@ -3,16 +3,74 @@ import tarfile
 import zipfile
 import argparse
 import shutil
+from ann_store import AnnotationStore
+from dataset import normalised_records
+from manifest import Manifest, file_stamp, data_hash
+from placement import place, strategies, default_strategy
+from registry import register, get_reader
+from instrument import stage, session, add_instrument_arguments
+from archive_index import TarIndex, seekable, extract_zip
 
 python_version = sys.version_info.major
 
-index = 0
 class Parser(object):
+
+    # reader interface (see registry.py), filled in by each dataset;
+    # fetch has no default, register() refuses readers without one
+    root = None
+    images_dir = None
+    image_ext = ".jpg"
+    json_dir = None
+    directories = []
+    subfolders = (None, None, None)
+
+    @staticmethod
+    def add_arguments(ap):
+        pass
+    @classmethod
+    def from_namespace(cls, namespace):
+        return cls()
+    @classmethod
+    def to_json(cls):
+        """
+            Definition: Command line conversion of the dataset archive to its annotation store.
+        """
+        namespace = Parser.createParser(cls)
+        with session(namespace):
+            reader = cls.from_namespace(namespace)
+            reader.make_directories(cls.directories, namespace.force)
+            # placed images are recorded per image next to them (as pipeline.py does); that
+            # manifest is let go before parsing, so the store is written holding no per-image state
+            manifest = Manifest(cls.root)
+            try:
+                source = reader.fetch(namespace, manifest)
+            finally:
+                manifest.close()
+            manifest = Manifest(cls.json_dir)
+            try:
+                reader.update_json_ann(cls.json_dir, manifest, *source)
+            finally:
+                manifest.close()
     
     #This part is for dataset extracting from archives
     @staticmethod
-    def createParser (default_imgs, default_anns, default_imgs_and_anns):
+    def createParser (reader):
         ap = argparse.ArgumentParser()
+        reader.add_reader_arguments(ap)
+        Parser.add_resume_arguments(ap)
+        ap.add_argument("--placement", default = default_strategy, choices = strategies, help = "How images are put in place: move (any link strategy) or copy")
+        add_instrument_arguments(ap)
+        namespace = ap.parse_args(sys.argv[1:])
+        return namespace
+    @classmethod
+    def add_reader_arguments(cls, ap):
+        # readers that do not convert an archive (subfolders is None) only get their own options
+        if cls.subfolders is None:
+            cls.add_arguments(ap)
+        else:
+            Parser.add_source_arguments(ap, *cls.subfolders, add_arguments=cls.add_arguments)
+    @staticmethod
+    def add_source_arguments(ap, default_imgs, default_anns, default_imgs_and_anns, add_arguments=None):
         # in case images and annotations are in different folders
         if default_imgs != None and default_anns != None:
             ap.add_argument("--imgs_subfolder", default=default_imgs, required = False, help = "Images subfolder to extract from")
@@ -20,8 +78,19 @@ class Parser(object):
         # in case images and annotations are in single folder    
         if default_imgs_and_anns != None:
              ap.add_argument("--imgs_and_anns_subfolder", default=default_imgs_and_anns, required = False, help = "Images and annotations subfolder to extract from")
-        namespace = ap.parse_args(sys.argv[1:])
-        return namespace
+        # read annotations straight from the archive and write images to their final folder in one pass
+        ap.add_argument("--stream", action = "store_true", help = "Convert without intermediate extraction")
+        ap.add_argument("--extract_workers", type=int, default=1, help = "Processes extracting archive members")
+        # dataset specific options
+        if add_arguments != None:
+            add_arguments(ap)
+    @staticmethod
+    def add_resume_arguments(ap):
+        # reruns skip items recorded in the manifest (default); --force rebuilds from scratch
+        group = ap.add_mutually_exclusive_group()
+        group.add_argument("--resume", dest = "force", action = "store_false", help = "Only process new or changed items (default)")
+        group.add_argument("--force", dest = "force", action = "store_true", help = "Remove previous output and convert everything")
+        ap.set_defaults(force = False)
     @staticmethod   
     def members( tf, subfolder):
         l = len(subfolder)
@@ -30,66 +99,178 @@ class Parser(object):
                 member.path = member.path[l:]
                 yield member
     @staticmethod
-    def extract( archive, subfolder, dir_path): 
-       
+    def extract( archive, subfolder, dir_path, workers=1, manifest=None):
+        Parser.extract_all(archive, [(subfolder, dir_path)], workers, manifest)
+    @staticmethod
+    def extract_all( archive, targets, workers=1, manifest=None):
+        """
+            Definition: Extracts the members under each (subfolder, dir_path) of targets.
+                        Uncompressed tars are read once through their persistent member
+                        index and zip members are split over workers processes
+                        (archive_index.py); zip members already extracted are skipped.
+                        With a manifest (the per-image one of the dataset root, see to_json),
+                        images already placed in dir_path by an earlier run (extracted or
+                        streamed) are not extracted again.
+        """
+        targets = [(subfolder, dir_path) for subfolder, dir_path in targets if os.path.exists(dir_path)]
+        skip, done = Parser.placed_images(archive, targets, manifest)
+        with stage('extract', archive + ":" + ",".join(subfolder for subfolder, dir_path in targets)) as s:
+            filename, file_extension = os.path.splitext(archive)
+            if file_extension != ".zip":
+                if seekable(archive):
+                    s.items = TarIndex(archive).extract(targets, workers, skip, done)
+                    return
+                # compressed tars are walked once per subfolder
+                for subfolder, dir_path in targets:
+                    with tarfile.open(archive) as tar:
+                        members = [(subfolder + member.path, {'size': member.size, 'mtime': member.mtime}, member)
+                                   for member in Parser.members(tar, subfolder)]
+                        if skip != None:
+                            members = [m for m in members if not (m[2].isfile() and skip(m[0], m[1], None))]
+                        s.items += len(members)
+                        tar.extractall(members=[m[2] for m in members], path = dir_path)
+                        if done != None:
+                            done([m[:2] + (None,) for m in members if m[2].isfile()])
+            if file_extension == '.zip':
+                with zipfile.ZipFile(archive) as _archive:
+                    names = _archive.namelist()
+                jobs = []
+                for subfolder, dir_path in targets:
+                    for file in names:
+                        if file.startswith(subfolder):
+                            filename, file_extension = os.path.splitext(file)
+                            if file_extension == '.jpg' or file_extension == '.mat' or file_extension == '.png' or filename == 'wider_face_split/wider_face_train_bbx_gt':
+                                # members keep their archive path under dir_path, as ZipFile.extract does
+                                if not os.path.isabs(file) and '..' not in file.split('/'):
+                                    jobs.append((file, os.path.join(dir_path, file)))
+                s.items = extract_zip(archive, jobs, workers, skip, done)
+    
+    @staticmethod
+    def placed_images(archive, targets, manifest):
+        """
+            Definition: Manifest checks for extraction. Images end up flat in the dir_path of
+                        their target (directly, or moved there by copy), so they share the
+                        keys, stamps and outputs of stream_extract.
+            Returns: (skip(name, stamp, target), done(list of (name, stamp, target))), or (None, None)
+        """
+        if manifest == None:
+            return None, None
+        def placed(name):
+            if os.path.splitext(name)[1].lower() not in ('.jpg', '.png'):
+                return None
+            for subfolder, dir_path in targets:
+                if name.startswith(subfolder):
+                    return os.path.join(dir_path, os.path.basename(name))
+        def skip(name, stamp, target):
+            return placed(name) != None and manifest.is_current(os.path.basename(archive) + ":" + name, stamp)
+        def done(members):
+            # recorded once extracted; until copy has moved an image into place its
+            # output is missing, so the manifest does not count it as current yet
+            for name, stamp, target in members:
+                if placed(name) != None:
+                    manifest.record(os.path.basename(archive) + ":" + name, stamp, [placed(name)])
+        return skip, done
+
+    @staticmethod
+    def stream_members(archive, subfolder):
+        """
+            Definition: Walks archive members under subfolder in a single sequential read.
+            Returns: generator of (member name, file object, stamp); the file object is only
+                     valid until the next member is requested, the stamp identifies the
+                     member contents for the manifest
+        """
         filename, file_extension = os.path.splitext(archive)
-        if file_extension != ".zip":
-            with tarfile.open(archive) as tar:
-                if os.path.exists(dir_path):  
-                    if subfolder.split(".") != "mat":
-                        tar.extractall(members=Parser.members(tar, subfolder), path = dir_path)
-                    else:
-                        for entry in tar:
-                            fileobj = tf.extractfile(entry)
-                            print(fileobj)
         if file_extension == '.zip':
-            _archive = zipfile.ZipFile(archive)
-            for file in _archive.namelist():
-                if file.startswith(subfolder):
-                    filename, file_extension = os.path.splitext(file)
-                    if file_extension == '.jpg' or file_extension == '.mat' or file_extension == '.png' or filename == 'wider_face_split/wider_face_train_bbx_gt':
-                        if os.path.exists(dir_path): 
-                            _archive.extract(file, dir_path)
-    
+            with zipfile.ZipFile(archive) as _archive:
+                for info in _archive.infolist():
+                    if info.filename.startswith(subfolder) and not info.filename.endswith('/'):
+                        with _archive.open(info) as fileobj:
+                            yield info.filename, fileobj, {'size': info.file_size, 'crc': info.CRC}
+        else:
+            # "r|*" reads the tar as a stream, so the header chain is never scanned twice
+            with tarfile.open(archive, "r|*") as tar:
+                for member in tar:
+                    if member.isfile() and member.name.startswith(subfolder):
+                        yield member.name, tar.extractfile(member), {'size': member.size, 'mtime': member.mtime}
+
+    @staticmethod
+    def stream_extract(archive, imgs_subfolder, dir_path, anns_subfolder=None, ann_exts=('.mat', '.txt'), manifest=None):
+        """
+            Definition: Copies images under imgs_subfolder flat into dir_path and collects
+                        annotation members under anns_subfolder, reading the archive once.
+                        Images already written from an identical member (per manifest) are skipped.
+            Returns: dict of annotation basename -> file contents (bytes)
+        """
+        if anns_subfolder is None:
+            anns_subfolder = imgs_subfolder
+        prefixes = tuple(p for p in (imgs_subfolder, anns_subfolder) if p is not None)
+        annotations = {}
+        with stage('stream_extract', archive) as s:
+            for name, fileobj, stamp in Parser.stream_members(archive, prefixes):
+                base = os.path.basename(name)
+                ext = os.path.splitext(base)[1].lower()
+                if imgs_subfolder is not None and name.startswith(imgs_subfolder) and ext in ('.jpg', '.png'):
+                    key = os.path.basename(archive) + ":" + name
+                    if manifest != None and manifest.is_current(key, stamp):
+                        continue
+                    target = os.path.join(dir_path, base)
+                    with open(target, "wb") as out:
+                        shutil.copyfileobj(fileobj, out)
+                    s.items += 1
+                    if manifest != None:
+                        manifest.record(key, stamp, [target])
+                elif name.startswith(anns_subfolder) and ext in ann_exts:
+                    annotations[base] = fileobj.read()
+        return annotations
+
     #This part is for dataset transformation(copy,rename,shuffle)
     @staticmethod           
-    def copy(subfolder, dir_path, names=None):
-        global index
-        for filename in glob.glob(os.path.join( dir_path + subfolder, "*.*")):
-            index += 1
-            shutil.copy(filename,  dir_path)
-        if os.path.exists(dir_path+subfolder):
-            shutil.rmtree( dir_path + subfolder)
+    def copy(subfolder, dir_path, names=None, placement=default_strategy):
+        # the subfolder is removed afterwards, so any link strategy amounts to a move:
+        # files are renamed into place and only "copy" duplicates bytes
+        with stage('copy', dir_path + subfolder) as s:
+            for filename in glob.glob(os.path.join( dir_path + subfolder, "*.*")):
+                s.items += 1
+                if placement == 'copy':
+                    shutil.copy(filename,  dir_path)
+                else:
+                    shutil.move(filename, os.path.join(dir_path, os.path.basename(filename)))
+            if os.path.exists(dir_path+subfolder):
+                shutil.rmtree( dir_path + subfolder)
             
-    # From .png to .jpg converter
-    @staticmethod
-    def Png_to_jpg_converter(filename, distination_path, img_name):
-        im = Image.open(filename)
-        im.save(distination_path + img_name.split(".png")[0] + ".jpg","jpeg")
-        os.remove(filename)
-        
     @staticmethod
-    def make_directories(sub_dir):
-        if type(sub_dir) != str:
-            if os.path.exists(sub_dir[0]):
-                if python_version == 3:
-                    prompt = input('Directories  already exists. Overwrite? (yes, no): ')
-                else:
-                    prompt = raw_input('Directoryies already exists. Overwrite? (yes, no): ')
-                if prompt == 'no':
-                    pass
-                if prompt == 'yes':
-                    shutil.rmtree(sub_dir[0])
+    def make_directories(sub_dir, force=False):
+        # existing directories are kept so a rerun can resume; force wipes them first
+        if type(sub_dir) == str:
+            sub_dir = [sub_dir]
+        if force:
             for i in range(len(sub_dir)):
+                if os.path.exists(sub_dir[i]):
+                    shutil.rmtree(sub_dir[i])
+        for i in range(len(sub_dir)):
+            if not os.path.exists(sub_dir[i]):
                 os.makedirs(sub_dir[i])
-        else:
-            os.makedirs(sub_dir)
     @staticmethod                  
     def populate_json_ann(json_path, par ):
-        #make & populate json annotation files
+        #populate the dataset annotation store (json_path/annotations.jsonl + offset index)
+        #par can be a generator: records are written as they are produced
         if par != None:
-            for i in par:
-                f= open(json_path+i["filename"].split('.')[0]+".json","w+")
-                f.write(str(i))
-                f.close()
+            with stage('write_store', json_path) as s:
+                s.items = AnnotationStore(json_path).write(normalised_records(par))
+                return s.items
+    @staticmethod
+    def update_json_ann(json_path, manifest, key, stamp, make_records):
+        """
+            Definition: Rebuilds the annotation store only when its source (stamp) changed
+                        since the last run; make_records is only called in that case.
+                        Records stream from the parser into the store, one at a time.
+        """
+        store = AnnotationStore(json_path)
+        if manifest.is_current(key, stamp):
+            print ("Annotations are up to date")
+            return
+        # parsing runs as the store consumes the records, so write_store is part of this stage
+        with stage('parse', key) as s:
+            s.items = Parser.populate_json_ann(json_path, make_records())
+        manifest.record(key, stamp, [store.path, store.index_path])
         
\ No newline at end of file
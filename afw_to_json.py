@@ -1,12 +1,9 @@
 # Import necessary libraries
-import os, sys
-import cv2
-from scipy.io import loadmat
-from h5py import File
-import h5py
+import os, sys, io
+import numpy as np
 from Parser import *
-from PIL import Image
-from six.moves import cPickle as pickle
+from lazy import lazy_import
+h5py = lazy_import('h5py')
 
 python_version = sys.version_info.major
 
@@ -20,6 +17,7 @@ python_version = sys.version_info.major
 # you will extract files from wich.
 # Sample: python afw_to_json.py --imgs_and_anns_subfolder testimages/
 # By defoult subfolder path for images & annotations extraction: "testimages/"
+# Add --stream to read anno.mat straight from the archive without extracting it first.
 
 dataset_archive = "AFW.zip"
 imgs_and_anns_subfolder = "testimages/"
@@ -27,55 +25,76 @@ imgs_and_anns_destination = 'datasets/AFW/'
 json_dir = 'datasets/JSON_AFW/'
 directories = [imgs_and_anns_destination, json_dir]
 annotations_file ='datasets/AFW/anno.mat'
+# images whose references are resolved per read
+chunk_size = 256
 
+@register('AFW')
 class AfwToJson(Parser):
+
+    root = 'datasets/AFW/'
+    images_dir = imgs_and_anns_destination
+    json_dir = json_dir
+    directories = directories
+    subfolders = (None, None, imgs_and_anns_subfolder)
     
-    def parse(debug=False):
-        with h5py.File(annotations_file) as data:
+    def read_refs(self, data, refs):
+        """
+        Definition: Resolves a batch of object references, reading each target in one call.
+        Returns: list of numpy arrays
+        """
+        return [data[ref][()] for ref in refs]
+
+    def parse(self, source=None, debug=False, chunk_size=chunk_size):
+        """
+            Definition: Reads AFW anno.mat (MATLAB v7.3) from annotations_file or from
+                        a file object when source is given. The reference table is read
+                        chunk_size images at a time and records are yielded lazily, so
+                        memory stays bounded whatever the file size.
+            Returns: generator of image records
+        """
+        with h5py.File(annotations_file if source is None else source, 'r') as data:
             
             annotations = data[u'anno']
-            '''
-                annotations[0] : length of data
-            '''
-            print ('Found {0} rows '.format(len(annotations[0])))
-            n = len(annotations[0])    
-            objects = []
-            for indx in range(n):
-                object_info = {}
-                img_info = annotations[1][indx]
-                # Image filename
-                obj = data[annotations[0][indx]]
-                object_info['filename'] = ''.join(chr(i) for i in obj[:])
-                if debug:
-                    print ('Processing {0} ({1}/{2})'.format(object_info['filename'], indx + 1, n))
-                object_info['objects'] = []
-                for face_indx in range(len(data[img_info])):
-
-                    face_info = {'class_name':'face'}
-
-                    # bounding box processing
-                    obj = data[data[img_info][face_indx][0] ]             
-                    x1, y1 = int(round(obj[0,0])), int(round(obj[1,0]))
-                    x2, y2 = int(round(obj[0,1])), int(round(obj[1,1]))
-                    face_info['bounding_box'] = [x1, y1, x2, y2]            
-
-                    # pose reading
-                    obj = data[data[annotations[2][indx]][face_indx][0]]
-                    yaw, pitch, roll   = float(obj[0]), float(obj[1]), float(obj[2])     
-                    face_info['pose'] = [yaw, pitch, roll]
+            # annotations[0] : filename references
+            # annotations[1] : bounding box cell references
+            # annotations[2] : pose cell references
+            n = annotations.shape[1]
+            print ('Found {0} rows '.format(n))
+            for start in range(0, n, chunk_size):
+                # one read for the filename, box and pose references of the whole chunk
+                refs = annotations[0:3, start:start + chunk_size]
+                names = self.read_refs(data, refs[0])
+                box_cells = self.read_refs(data, refs[1])
+                pose_cells = self.read_refs(data, refs[2])
+                for j in range(refs.shape[1]):
+                    # MATLAB chars are stored as uint16 code units
+                    filename = names[j].astype(np.uint16).tobytes().decode('utf-16-le')
+                    if debug:
+                        print ('Processing {0} ({1}/{2})'.format(filename, start + j + 1, n))
+                    boxes = [np.rint(box).astype(int) for box in self.read_refs(data, box_cells[j].ravel())]
+                    poses = self.read_refs(data, pose_cells[j].ravel())
+                    objects = []
+                    for box, pose in zip(boxes, poses):
+                        objects.append({'class_name':'face',
+                                        'bounding_box': [int(box[0, 0]), int(box[1, 0]), int(box[0, 1]), int(box[1, 1])],
+                                        'pose': [float(v) for v in pose.ravel()[:3]]})
+                    yield {'filename': filename, 'objects': objects}
 
-                    object_info['objects'].append(face_info)
+    def fetch(self, namespace, manifest):
+        """
+            Definition: Puts the images in place (streamed or extracted).
+            Returns: (anno.mat key, its stamp, callable returning the record generator)
+        """
+        key = os.path.basename(annotations_file)
+        if namespace.stream:
+            anns = self.stream_extract(dataset_archive, namespace.imgs_and_anns_subfolder, imgs_and_anns_destination, ann_exts=('.mat',), manifest=manifest)
+            data = anns[key]
+            return key, {'sha1': data_hash(data)}, lambda: self.parse(io.BytesIO(data))
+        self.extract(dataset_archive, namespace.imgs_and_anns_subfolder, imgs_and_anns_destination, namespace.extract_workers, manifest)
+        self.copy(imgs_and_anns_subfolder, imgs_and_anns_destination, names=None, placement=namespace.placement)
+        return key, file_stamp(annotations_file, True), self.parse
 
-                objects.append(object_info)
-                
-            return objects
 def main():
-    namespace = Parser.createParser (None, None, imgs_and_anns_subfolder)
-    afw =  AfwToJson()
-    #make afw directory
-    afw.make_directories(directories)
-    afw.extract(dataset_archive, namespace.imgs_and_anns_subfolder, imgs_and_anns_destination)
-    afw.copy(imgs_and_anns_subfolder, imgs_and_anns_destination, names=None)
-    afw.populate_json_ann(json_dir, afw.parse())
+    AfwToJson.to_json()
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Import necessary libraries
+import os, json
+import math
+
+###########################################################
+##########     Consolidated annotation store     ##########
+###########################################################
+
+# All image records of a converted dataset live in one JSON Lines file
+# (one record per line) with a filename -> byte offset index next to it.
+# Sample:
+#   store = AnnotationStore('datasets/JSON_AFW/')
+#   store.write(records)          # converters
+#   record = store['afw_0001.jpg'] # random access by filename
+#   for record in store: ...      # whole-dataset streaming
+
+store_name = 'annotations.jsonl'
+index_suffix = '.idx'
+
+
+def to_json_value(value):
+    """
+        Definition: Converts numpy scalars/arrays and NaN floats into plain JSON values.
+    """
+    if isinstance(value, dict):
+        return dict((k, to_json_value(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(v) for v in value]
+    if hasattr(value, 'tolist'):
+        return to_json_value(value.tolist())
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class AnnotationStore(object):
+    """
+        Definition: JSON Lines annotation file with a filename -> offset index.
+    """
+    def __init__(self, path):
+        # path can be the dataset json folder or the .jsonl file itself
+        if os.path.isdir(path) or path.endswith('/'):
+            path = os.path.join(path, store_name)
+        self.path = path
+        self.index_path = path + index_suffix
+        self._index = None
+        self._file = None
+
+    @staticmethod
+    def exists(path):
+        if os.path.isdir(path) or path.endswith('/'):
+            path = os.path.join(path, store_name)
+        return os.path.isfile(path)
+
+    def write(self, records):
+        """
+            Definition: Writes records (any iterable, consumed lazily) and the offset index.
+            Returns: number of records written
+        """
+        self.close()
+        count = 0
+        # both files are written next to the old ones and only swapped in once every
+        # record was produced, so a parse that fails midway leaves the store as it was;
+        # the index is written as it goes (same JSON as json.dump of the dict),
+        # so nothing is kept per record
+        tmp_path, tmp_index = self.path + '.tmp', self.index_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f, open(tmp_index, 'w') as index:
+                index.write('{')
+                for record in records:
+                    line = json.dumps(to_json_value(record), separators=(',', ':')).encode('utf-8')
+                    index.write((', ' if count else '') + json.dumps(record['filename']) + ': ' + str(f.tell()))
+                    f.write(line + b'\n')
+                    count += 1
+                index.write('}')
+        except BaseException:
+            for path in (tmp_path, tmp_index):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        os.replace(tmp_path, self.path)
+        os.replace(tmp_index, self.index_path)
+        self._index = None
+        return count
+
+    @property
+    def index(self):
+        if self._index is None:
+            if os.path.isfile(self.index_path):
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            else:
+                self._index = self.build_index()
+        return self._index
+
+    def build_index(self):
+        """
+            Definition: Rebuilds the filename -> offset index by scanning the store once.
+        """
+        index = {}
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                index[json.loads(line)['filename']] = offset
+                offset += len(line)
+        return index
+
+    def filenames(self):
+        return list(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, filename):
+        return filename in self.index
+
+    def __getitem__(self, filename):
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        self._file.seek(self.index[filename])
+        return json.loads(self._file.readline())
+
+    def get(self, filename, default=None):
+        if filename not in self.index:
+            return default
+        return self[filename]
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        # open file handles do not survive pickling into worker processes
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
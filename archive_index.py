@@ -0,0 +1,333 @@
+# Import necessary libraries
+import os, json
+import struct
+import tarfile
+import zipfile
+import zlib
+import shutil
+import multiprocessing
+
+###########################################################
+##########     Indexed tar member extraction     ##########
+###########################################################
+
+# Listing the members of a tar means walking its whole header chain. The first
+# time an uncompressed tar is extracted its regular files are saved to
+# datasets/archive_index/<archive>.json as name -> (data offset, size, mode,
+# mtime), stamped with the archive size and mtime, and reused while the archive
+# is unchanged. Symbolic links are indexed as name -> (link name, mtime) and
+# recreated; hard links are indexed with the data of the member they point to
+# and written as a copy of it (what tar extraction falls back to when it cannot
+# link). Members are then read by seeking straight to their data, any
+# number of subfolders is served by one call, and with workers > 1 each process
+# copies a contiguous share of the members through its own file handle.
+# Compressed tars cannot be seeked into; Parser.extract handles them as before.
+# Sample:
+#   index = TarIndex('INRIAPerson.tar')
+#   index.extract([('INRIAPerson/Train/pos/', 'datasets/INRIA/images/'),
+#                  ('INRIAPerson/Train/annotations/', 'datasets/INRIA/annotations/')], workers=4)
+
+index_dir = 'datasets/archive_index/'
+buffer_size = 1 << 20
+# most members handed to one process at a time; progress is reported per share
+share_size = 1024
+
+
+def seekable(archive):
+    """
+        Returns: True when archive is an uncompressed tar
+    """
+    try:
+        with tarfile.open(archive, 'r:'):
+            return True
+    except tarfile.TarError:
+        return False
+
+
+def _make_folders(paths):
+    for folder in set(os.path.dirname(path) for path in paths):
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+
+def _run_shares(func, archive, jobs, workers=1, done=None):
+    """
+        Definition: Runs func((archive, share)) over contiguous shares of jobs, on workers
+                    processes when workers > 1, so every reader stays sequential within
+                    its part of the archive. done(share) is called as each share finishes,
+                    in order.
+        Returns: sum of the results
+    """
+    step = min(share_size, max(1, (len(jobs) + workers - 1) // workers))
+    shares = [jobs[i:i + step] for i in range(0, len(jobs), step)]
+    pool = None
+    if workers <= 1 or len(jobs) < 2 * workers:
+        results = (func((archive, share)) for share in shares)
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(func, [(archive, share) for share in shares])
+    try:
+        total = 0
+        for share, result in zip(shares, results):
+            total += result
+            if done is not None:
+                done(share)
+        return total
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+class TarIndex(object):
+    """
+        Definition: Persistent name -> (offset, size, mode, mtime) index of an uncompressed tar
+                    and of its symbolic links.
+    """
+    def __init__(self, archive, index_dir=index_dir):
+        self.archive = archive
+        self.path = os.path.join(index_dir, os.path.basename(archive) + '.json')
+        self._members = None
+        self._links = None
+
+    def stamp(self):
+        st = os.stat(self.archive)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    @property
+    def members(self):
+        self.load()
+        return self._members
+
+    @property
+    def links(self):
+        self.load()
+        return self._links
+
+    def load(self):
+        if self._members is None:
+            stamp = self.stamp()
+            if os.path.isfile(self.path):
+                with open(self.path) as f:
+                    saved = json.load(f)
+                # indexes written before links were recorded are rebuilt
+                if saved['stamp'] == stamp and 'links' in saved:
+                    self._members, self._links = saved['members'], saved['links']
+            if self._members is None:
+                self._members, self._links = self.build()
+                self.save(stamp)
+
+    def build(self):
+        """
+            Definition: Walks the header chain once.
+            Returns: (dict of file name -> [data offset, size, mode, mtime],
+                      dict of symbolic link name -> [link name, mtime])
+        """
+        members, links = {}, {}
+        with tarfile.open(self.archive, 'r:') as tar:
+            member = tar.next()
+            while member is not None:
+                if member.isfile():
+                    members[member.name] = [member.offset_data, member.size, member.mode, member.mtime]
+                elif member.islnk() and member.linkname in members:
+                    # a hard link always follows the member it points to
+                    offset, size = members[member.linkname][:2]
+                    members[member.name] = [offset, size, member.mode, member.mtime]
+                elif member.issym():
+                    links[member.name] = [member.linkname, member.mtime]
+                # next() reads the header at tar.offset, moves tar.offset past the
+                # member and appends its TarInfo to tar.members, a list only read by
+                # getmembers()/getmember()/iteration, none of which is used here;
+                # dropping it keeps memory flat on archives with millions of members
+                tar.members = []
+                member = tar.next()
+        return members, links
+
+    def save(self, stamp):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'archive': os.path.abspath(self.archive), 'stamp': stamp, 'members': self._members,
+                       'links': self._links}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    @staticmethod
+    def _target(name, subfolder, dir_path):
+        # the path below subfolder kept under dir_path, None when it would land outside
+        if not name.startswith(subfolder):
+            return None
+        relative = name[len(subfolder):]
+        if not relative or os.path.isabs(relative) or '..' in relative.split('/'):
+            return None
+        return os.path.join(dir_path, relative)
+
+    def select(self, targets):
+        """
+            Definition: Members under each (subfolder, dir_path) of targets, with the path
+                        below subfolder kept under dir_path (as tar extraction of Parser.members).
+                        Members that would land outside dir_path are left out.
+            Returns: list of (offset, size, mode, mtime, target path, member name), in archive order
+        """
+        jobs = []
+        for name, (offset, size, mode, mtime) in self.members.items():
+            for subfolder, dir_path in targets:
+                target = self._target(name, subfolder, dir_path)
+                if target is not None:
+                    jobs.append((offset, size, mode, mtime, target, name))
+        return sorted(jobs)
+
+    def make_links(self, targets):
+        """
+            Definition: Recreates the symbolic links under each (subfolder, dir_path) of targets,
+                        pointing where they point in the archive (as tar extraction does).
+            Returns: number of links made
+        """
+        count = 0
+        for name, (linkname, mtime) in self.links.items():
+            for subfolder, dir_path in targets:
+                target = self._target(name, subfolder, dir_path)
+                if target is None:
+                    continue
+                _make_folders([target])
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.symlink(linkname, target)
+                count += 1
+        return count
+
+    def extract(self, targets, workers=1, skip=None, done=None):
+        """
+            Definition: Copies the members of select(targets) into place, on workers processes.
+                        Members for which skip(name, stamp, target) is true are left out and
+                        done(list of (name, stamp, target)) is called as shares finish; the
+                        stamps are those of Parser.stream_members.
+            Returns: number of extracted members
+        """
+        jobs = self.select(targets)
+        if skip is not None:
+            jobs = [job for job in jobs if not skip(*_tar_member(job))]
+        _make_folders(job[4] for job in jobs)
+        count = _run_shares(_copy_members, self.archive, jobs, workers,
+                            None if done is None else lambda share: done([_tar_member(job) for job in share]))
+        # links last, so a link to a member extracted here never dangles in between
+        return count + self.make_links(targets)
+
+
+def _tar_member(job):
+    offset, size, mode, mtime, target, name = job
+    return name, {'size': size, 'mtime': mtime}, target
+
+
+def _copy_members(args):
+    archive, jobs = args
+    with open(archive, 'rb') as f:
+        for offset, size, mode, mtime, target, name in jobs:
+            f.seek(offset)
+            with open(target, 'wb') as out:
+                left = size
+                while left:
+                    data = f.read(min(left, buffer_size))
+                    if not data:
+                        raise IOError("{0} is truncated at {1}".format(archive, target))
+                    out.write(data)
+                    left -= len(data)
+            # same permissions and times as tar extraction
+            os.chmod(target, mode & 0o777)
+            os.utime(target, (mtime, mtime))
+    return len(jobs)
+
+
+###########################################################
+##########     Parallel zip member extraction    ##########
+###########################################################
+
+# Zip members can be read independently: the wanted members are split into
+# contiguous shares, one per process, each reading through its own ZipFile
+# handle. Stored (uncompressed) members are copied straight from their local
+# entry without going through the decompressor; compressed ones are inflated
+# by ZipFile. Both are CRC checked. Files already at their target with the
+# member's size and CRC (left by an interrupted extraction) are not rewritten;
+# members the converters already moved elsewhere are skipped through the
+# manifest (see Parser.placed_images), so a rerun only writes what changed.
+# Sample:
+#   extract_zip('WIDER_train.zip', [(name, 'datasets/WIDER/images/' + name) for name in names], workers=4)
+
+local_header = struct.Struct('<4s22xHH')
+
+
+def extract_zip(archive, jobs, workers=1, skip=None, done=None):
+    """
+        Definition: Extracts (member name, target path) jobs of a zip archive on workers processes.
+                    Members for which skip(name, stamp, target) is true are left out and
+                    done(list of (name, stamp, target)) is called as shares finish; the
+                    stamps are those of Parser.stream_members.
+        Returns: number of members written (members already in place are not counted)
+    """
+    with zipfile.ZipFile(archive) as _archive:
+        infos = dict((info.filename, info) for info in _archive.infolist())
+    def member(job):
+        info = infos[job[0]]
+        return job[0], {'size': info.file_size, 'crc': info.CRC}, job[1]
+    jobs = sorted(jobs, key=lambda job: infos[job[0]].header_offset)
+    if skip is not None:
+        jobs = [job for job in jobs if not skip(*member(job))]
+    _make_folders(target for name, target in jobs)
+    return _run_shares(_extract_zip_members, archive, jobs, workers,
+                       None if done is None else lambda share: done([member(job) for job in share]))
+
+
+def file_crc(filename):
+    crc = 0
+    with open(filename, 'rb') as f:
+        for data in iter(lambda: f.read(buffer_size), b''):
+            crc = zlib.crc32(data, crc)
+    return crc & 0xffffffff
+
+
+def in_place(target, info):
+    return (os.path.isfile(target) and os.path.getsize(target) == info.file_size
+            and file_crc(target) == info.CRC)
+
+
+def _copy_stored(raw, info, target):
+    """
+        Definition: Copies the data of a stored member straight from its local entry.
+        Returns: CRC-32 of the copied bytes
+    """
+    raw.seek(info.header_offset)
+    signature, name_length, extra_length = local_header.unpack(raw.read(local_header.size))
+    if signature != b'PK\x03\x04':
+        raise zipfile.BadZipFile("Bad local header for {0}".format(info.filename))
+    raw.seek(info.header_offset + local_header.size + name_length + extra_length)
+    crc = 0
+    with open(target, 'wb') as out:
+        left = info.compress_size
+        while left:
+            data = raw.read(min(left, buffer_size))
+            if not data:
+                raise zipfile.BadZipFile("{0} is truncated".format(info.filename))
+            crc = zlib.crc32(data, crc)
+            out.write(data)
+            left -= len(data)
+    return crc & 0xffffffff
+
+
+def _extract_zip_members(args):
+    archive, jobs = args
+    written = 0
+    with zipfile.ZipFile(archive) as _archive, open(archive, 'rb') as raw:
+        for name, target in jobs:
+            info = _archive.getinfo(name)
+            if in_place(target, info):
+                continue
+            # bit 0: encrypted, left to ZipFile
+            if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                if _copy_stored(raw, info, target) != info.CRC:
+                    raise zipfile.BadZipFile("Bad CRC-32 for file {0}".format(name))
+            else:
+                # ZipFile checks the CRC itself when the member is read to the end
+                with _archive.open(info) as src, open(target, 'wb') as out:
+                    shutil.copyfileobj(src, out, buffer_size)
+            written += 1
+    return written
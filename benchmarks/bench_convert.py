@@ -0,0 +1,168 @@
+# Import necessary libraries
+import os, sys, json, time, argparse
+import platform
+import shutil
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from registry import modules
+from synthetic import formats, generate
+
+###########################################################
+##########     End to end conversion benchmark   ##########
+###########################################################
+
+# Generates synthetic archives (see synthetic.py) in a scratch folder and runs,
+# for every dataset, the archive -> JSON converter and then json_to_pascalVoc.py
+# as separate processes with --report, so each command is timed end to end and
+# per stage (extract, copy, parse, write_store, voc_jobs, voc_export, ...).
+# Every run is appended as one JSON line to --results (by default the untracked
+# benchmarks/results/bench_convert.jsonl) together with the scale,
+# the commit and the machine, and compared with the latest earlier run of the
+# same scale and options: commands that got slower than --tolerance times
+# are flagged. Needs no network; the scratch folder is removed afterwards
+# unless --keep is given.
+# Sample: python benchmarks/bench_convert.py --images 10000 --boxes 3
+# Sample: python benchmarks/bench_convert.py --images 1000 --datasets WIDER AFW --stream --workers 4 --repeat 3
+
+root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+# results are per machine, so they stay out of version control (see .gitignore)
+default_results = os.path.join(root, 'benchmarks', 'results', 'bench_convert.jsonl')
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(script, args, workdir, report):
+    """
+        Definition: Runs one script of the repository in workdir with --report.
+        Returns: (wall seconds, stages of the report)
+    """
+    command = [sys.executable, os.path.join(root, script)] + args + ['--report', report]
+    start = time.time()
+    subprocess.check_call(command, cwd=workdir, stdout=subprocess.DEVNULL)
+    wall = time.time() - start
+    with open(report) as f:
+        return wall, json.load(f)['stages']
+
+
+def commands(dataset, args):
+    """
+        Returns: list of (name, script, arguments) benchmarked for one dataset
+    """
+    convert = ['--force'] + (['--stream'] if args.stream else [])
+    voc = ['--dataset', dataset, '--force', '--workers', str(args.workers)]
+    return [(dataset + ' to_json', modules[dataset] + '.py', convert),
+            (dataset + ' voc', 'json_to_pascalVoc.py', voc)]
+
+
+def bench(args, workdir):
+    """
+        Definition: Times every command --repeat times and keeps the run with the median wall time.
+        Returns: list of result entries
+    """
+    results = []
+    for dataset in args.datasets:
+        for name, script, script_args in commands(dataset, args):
+            runs = []
+            for i in range(args.repeat):
+                runs.append(run(script, script_args, workdir, os.path.join(workdir, 'report.json')))
+            wall, stages = sorted(runs, key=lambda r: r[0])[len(runs) // 2]
+            print ("{0:<24}{1:>9.3f} s".format(name, wall))
+            results.append({'command': name, 'wall_s': round(wall, 4),
+                            'stages': [dict((k, s[k]) for k in ('stage', 'depth', 'wall_s', 'items', 'items_per_s',
+                                                                 'bytes_read', 'bytes_written', 'peak_rss_mb'))
+                                       for s in stages]})
+    return results
+
+
+def settings(args):
+    return {'images': args.images, 'boxes': args.boxes, 'datasets': args.datasets, 'unique': args.unique,
+            'stream': args.stream, 'workers': args.workers, 'seed': args.seed}
+
+
+def previous(results_file, config, host):
+    """
+        Returns: latest earlier entry of results_file with the same settings on the same host, or None
+    """
+    if not os.path.isfile(results_file):
+        return None
+    last = None
+    with open(results_file) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if entry['settings'] == config and entry['host'] == host:
+                    last = entry
+    return last
+
+
+def compare(results, before, tolerance):
+    """
+        Returns: names of the commands slower than tolerance times their earlier wall time
+    """
+    walls = dict((r['command'], r['wall_s']) for r in before['results'])
+    slower = []
+    print ("Compared with {0} ({1}):".format(before['commit'], before['time']))
+    for r in results:
+        if r['command'] not in walls or walls[r['command']] <= 0:
+            continue
+        ratio = r['wall_s'] / walls[r['command']]
+        flag = "  SLOWER" if ratio > tolerance else ""
+        print ("{0:<24}{1:>9.3f} -> {2:.3f} s  x{3:.2f}{4}".format(r['command'], walls[r['command']], r['wall_s'], ratio, flag))
+        if flag:
+            slower.append(r['command'])
+    return slower
+
+
+def createParser():
+    ap = argparse.ArgumentParser(description="Time the converters and the VOC export on synthetic archives")
+    ap.add_argument("--images", type=int, default=1000, help = "Images per dataset")
+    ap.add_argument("--boxes", type=int, default=2, help = "Average boxes per image")
+    ap.add_argument("--datasets", nargs="+", default=list(formats), choices=formats, help = "Datasets to benchmark")
+    ap.add_argument("--unique", action = "store_true", help = "Encode a different image for every file")
+    ap.add_argument("--stream", action = "store_true", help = "Convert with --stream")
+    ap.add_argument("--workers", type=int, default=1, help = "Processes of the VOC export")
+    ap.add_argument("--repeat", type=int, default=1, help = "Runs per command; the median is kept")
+    ap.add_argument("--seed", type=int, default=0, help = "Seed of the synthetic archives")
+    ap.add_argument("--workdir", default=None, help = "Scratch folder (a temporary one by default)")
+    ap.add_argument("--keep", action = "store_true", help = "Keep the scratch folder")
+    ap.add_argument("--results", default=default_results, help = "JSON lines file the results are appended to")
+    ap.add_argument("--tolerance", type=float, default=1.2, help = "Slowdown ratio flagged as a regression")
+    return ap
+
+
+def main():
+    args = createParser().parse_args(sys.argv[1:])
+    workdir = args.workdir or tempfile.mkdtemp(prefix='dataprocess_bench_')
+    host = {'node': platform.node(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'python': platform.python_version()}
+    try:
+        start = time.time()
+        generate(workdir, args.images, args.boxes, args.datasets, args.unique, args.seed)
+        print ("Generated {0} images per dataset in {1:.1f} s ({2})".format(args.images, time.time() - start, workdir))
+        results = bench(args, workdir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    config = settings(args)
+    before = previous(args.results, config, host)
+    entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit(), 'host': host,
+             'settings': config, 'results': results}
+    results_dir = os.path.dirname(args.results)
+    if results_dir and not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    print ("Results appended to {0}".format(args.results))
+    if before is not None and compare(results, before, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
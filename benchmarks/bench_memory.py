@@ -0,0 +1,70 @@
+# Import necessary libraries
+import os, sys, argparse
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from registry import modules
+from synthetic import formats, generate
+from bench_convert import run
+
+###########################################################
+##########     Converter memory benchmark        ##########
+###########################################################
+
+# Runs the archive -> JSON converters on synthetic archives of growing size
+# with --tracemalloc and reports the peak of traced Python/NumPy allocations
+# while parsing and writing the annotation store, next to the peak RSS of the
+# process. Records stream from the parser into the store, so the traced peak
+# should stay flat as the image count grows; what is left grows only with the
+# source file the format makes us load whole (IMDB-WIKI .mat metadata).
+# Sample: python benchmarks/bench_memory.py --scales 1000 10000 100000 --datasets WIDER IMDB-WIKI
+
+
+def parse_peak(stages):
+    """
+        Returns: (traced peak MB, peak RSS MB) of the parse stage and the stages inside it
+    """
+    inside = False
+    traced, rss = 0.0, 0.0
+    for entry in stages:
+        if entry['stage'] == 'parse':
+            inside = True
+        elif entry['depth'] <= 1:
+            inside = False
+        if inside:
+            traced = max(traced, entry.get('traced_peak_mb') or 0.0)
+            rss = max(rss, entry['peak_rss_mb'] or 0.0)
+    return traced, rss
+
+
+def createParser():
+    ap = argparse.ArgumentParser(description="Peak memory of the converters as the dataset grows")
+    ap.add_argument("--scales", type=int, nargs="+", default=[1000, 4000, 16000], help = "Images per dataset of each run")
+    ap.add_argument("--boxes", type=int, default=2, help = "Average boxes per image")
+    ap.add_argument("--datasets", nargs="+", default=list(formats), choices=formats, help = "Datasets to measure")
+    ap.add_argument("--stream", action = "store_true", help = "Convert with --stream")
+    return ap
+
+
+def main():
+    args = createParser().parse_args(sys.argv[1:])
+    peaks = dict((dataset, []) for dataset in args.datasets)
+    for n in args.scales:
+        workdir = tempfile.mkdtemp(prefix='dataprocess_mem_')
+        try:
+            generate(workdir, n, args.boxes, args.datasets)
+            for dataset in args.datasets:
+                script_args = ['--force', '--tracemalloc'] + (['--stream'] if args.stream else [])
+                wall, stages = run(modules[dataset] + '.py', script_args, workdir, os.path.join(workdir, 'report.json'))
+                peaks[dataset].append(parse_peak(stages))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print ("{0:<12}".format("images") + "".join("{0:>22}".format(n) for n in args.scales))
+    for dataset in args.datasets:
+        print ("{0:<12}".format(dataset) + "".join("{0:>10.1f} MB {1:>6.0f} RSS".format(traced, rss)
+                                                   for traced, rss in peaks[dataset]))
+    print ("traced: peak Python/NumPy allocations while parsing and writing the store; RSS: process peak")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Import necessary libraries
+import os, sys, time, argparse
+import subprocess
+
+###########################################################
+##########         CLI startup benchmark         ##########
+###########################################################
+
+# Measures the wall time of fresh interpreters importing each module and
+# printing each script's --help, i.e. the fixed cost a batch job pays per
+# invocation before any work is done. Reports the median of --repeat runs.
+# Add --importtime to print the slowest imports (python -X importtime) per module.
+# Sample: python benchmarks/bench_startup.py --repeat 20
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+modules = ['afw_to_json', 'imdb_wiki_to_json', 'inria_to_json', 'wider_to_json',
+           'json_to_pascalVoc', 'pipeline', 'visualisation_tool']
+
+
+def timed(command, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call(command, cwd=root, stdout=subprocess.DEVNULL)
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def slowest_imports(module, count=5):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=root, stderr=subprocess.PIPE, universal_newlines=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--importtime", action="store_true")
+    namespace = ap.parse_args()
+    baseline = timed([sys.executable, '-c', 'pass'], namespace.repeat)
+    print("{0:<22}{1:>10}{2:>10}".format("module", "import", "--help"))
+    print("{0:<22}{1:>8.0f}ms".format("(interpreter)", baseline * 1000))
+    for module in modules:
+        imported = timed([sys.executable, '-c', 'import ' + module], namespace.repeat)
+        helped = timed([sys.executable, module + '.py', '--help'], namespace.repeat)
+        print("{0:<22}{1:>8.0f}ms{2:>8.0f}ms".format(module, imported * 1000, helped * 1000))
+        if namespace.importtime:
+            for cumulative, name in slowest_imports(module):
+                print("    {0:>8.1f}ms  {1}".format(cumulative / 1000.0, name))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Import necessary libraries
+import os, sys, time, argparse
+import random
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from json_to_pascalVoc import JsonToPascalVoc
+from voc_xml import voc_xml
+
+###########################################################
+##########     VOC XML writer benchmark          ##########
+###########################################################
+
+# Times the lxml element builder against the templated writer on synthetic
+# annotations and checks that both produce the same bytes.
+# Sample: python benchmarks/bench_voc_xml.py --images 20000 --boxes 4
+
+
+def synthetic(images, boxes, seed=0):
+    rng = random.Random(seed)
+    for i in range(images):
+        n = rng.randint(1, 2 * boxes - 1)
+        coords = []
+        for _ in range(n):
+            x, y = rng.randint(0, 900), rng.randint(0, 700)
+            coords.append([x, y, x + rng.randint(8, 120), y + rng.randint(8, 120)])
+        person = i % 2 == 0
+        genders = [rng.choice([0.0, 1.0, None]) for _ in range(n)] if person else []
+        ages = [rng.randint(1, 90) for _ in range(n)] if person else []
+        yield ("datasets/JSON_BENCH/img_{0:06d}.jpg".format(i), ['face'] * n, coords, 1024, 768, genders, ages)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=20000)
+    ap.add_argument("--boxes", type=int, default=4, help="mean boxes per image")
+    namespace = ap.parse_args()
+    samples = list(synthetic(namespace.images, namespace.boxes))
+    # to_pasvoc_xml does not touch instance state
+    builder = JsonToPascalVoc.__new__(JsonToPascalVoc)
+
+    start = time.time()
+    expected = [etree.tostring(builder.to_pasvoc_xml(*s), pretty_print=True) for s in samples]
+    lxml_time = time.time() - start
+    start = time.time()
+    actual = [voc_xml(*s) for s in samples]
+    template_time = time.time() - start
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print("images: {0}  boxes: {1}".format(len(samples), sum(len(s[2]) for s in samples)))
+    print("lxml builder: {0:.3f}s ({1:.0f} files/s)".format(lxml_time, len(samples) / lxml_time))
+    print("template:     {0:.3f}s ({1:.0f} files/s)".format(template_time, len(samples) / template_time))
+    print("speedup:      {0:.1f}x".format(lxml_time / template_time))
+    print("mismatches:   {0}".format(mismatches))
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
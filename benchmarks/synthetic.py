@@ -0,0 +1,221 @@
+# Import necessary libraries
+import io, os, sys, argparse
+import tarfile
+import zipfile
+import numpy as np
+
+###########################################################
+##########     Synthetic dataset archives        ##########
+###########################################################
+
+# Writes archives laid out like the real downloads, so every converter can run
+# offline on any scale:
+#   WIDER_train.zip + wider_face_split.zip  (bbx_gt text, event folders)
+#   INRIAPerson.tar                          (PASCAL annotation text, .png images)
+#   AFW.zip                                  (anno.mat, MATLAB v7.3 / HDF5)
+#   wiki_crop.tar                            (wiki.mat, MATLAB v5 struct)
+# Images are tiny; by default all images of a format share the same encoded
+# bytes, --unique encodes one per image (slower, but needed for deduplication).
+# Boxes and metadata come from a seeded generator, so the same arguments always
+# give the same archives.
+# Sample: python benchmarks/synthetic.py --out /tmp/bench --images 10000 --boxes 3
+# Sample: python benchmarks/synthetic.py --out /tmp/bench --images 1000 --formats WIDER AFW --unique
+
+formats = ('WIDER', 'INRIA', 'AFW', 'IMDB-WIKI')
+image_size = (64, 48)
+
+
+class Images(object):
+    """
+        Definition: Encoded tiny images, shared or one per index.
+    """
+    def __init__(self, fmt, unique=False, size=image_size, seed=0):
+        self.fmt = fmt
+        self.unique = unique
+        self.size = size
+        self.rng = np.random.RandomState(seed)
+        self.shared = None if unique else self.encode()
+
+    def encode(self):
+        from PIL import Image
+        pixels = self.rng.randint(0, 256, (self.size[1], self.size[0], 3)).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, self.fmt)
+        return buf.getvalue()
+
+    def get(self, i):
+        return self.encode() if self.unique else self.shared
+
+
+def random_boxes(rng, count, size=image_size):
+    """
+        Returns: int (count, 4) array of x1, y1, x2, y2 boxes inside an image of size (w, h)
+    """
+    w, h = size
+    x1 = rng.randint(0, w // 2, count)
+    y1 = rng.randint(0, h // 2, count)
+    x2 = x1 + rng.randint(2, w // 2, count)
+    y2 = y1 + rng.randint(2, h // 2, count)
+    return np.stack([x1, y1, x2, y2], axis=1)
+
+
+def box_counts(rng, n, boxes):
+    # between 1 and 2 * boxes - 1 boxes per image, boxes on average
+    return rng.randint(1, 2 * boxes, n) if boxes > 1 else np.ones(n, dtype=int)
+
+
+def add_zip(archive, name, data):
+    archive.writestr(name, data)
+
+
+def add_tar(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    archive.addfile(info, io.BytesIO(data))
+
+
+def wider(out, n, boxes, unique=False, seed=0):
+    """
+        Definition: WIDER_train.zip with images in event folders and
+                    wider_face_split.zip with wider_face_train_bbx_gt.txt.
+    """
+    rng = np.random.RandomState(seed)
+    images = Images('JPEG', unique, seed=seed)
+    counts = box_counts(rng, n, boxes)
+    gt = []
+    with zipfile.ZipFile(os.path.join(out, 'WIDER_train.zip'), 'w') as archive:
+        for i in range(n):
+            event = '{0}--Event{0}'.format(i % 61)
+            name = '{0}_Event{0}_{1}.jpg'.format(i % 61, i)
+            add_zip(archive, 'WIDER_train/images/{0}/{1}'.format(event, name), images.get(i))
+            gt.append('{0}/{1}'.format(event, name))
+            gt.append(str(counts[i]))
+            for x1, y1, x2, y2 in random_boxes(rng, counts[i]).tolist():
+                # x y w h blur expression illumination invalid occlusion pose
+                gt.append('{0} {1} {2} {3} {4} 0 0 0 {5} 0 '.format(x1, y1, x2 - x1, y2 - y1, i % 3, i % 2))
+    with zipfile.ZipFile(os.path.join(out, 'wider_face_split.zip'), 'w') as archive:
+        add_zip(archive, 'wider_face_split/wider_face_train_bbx_gt.txt', '\n'.join(gt) + '\n')
+
+
+def inria(out, n, boxes, unique=False, seed=0):
+    """
+        Definition: INRIAPerson.tar with Train/pos .png images and one annotation text per image.
+    """
+    rng = np.random.RandomState(seed)
+    images = Images('PNG', unique, seed=seed)
+    counts = box_counts(rng, n, boxes)
+    with tarfile.open(os.path.join(out, 'INRIAPerson.tar'), 'w') as archive:
+        for i in range(n):
+            name = 'person_{0:07d}'.format(i)
+            add_tar(archive, 'INRIAPerson/Train/pos/{0}.png'.format(name), images.get(i))
+            text = '# PASCAL Annotation Version 1.00\r\n\r\nImage filename : "Train/pos/{0}.png"\r\n'.format(name)
+            text += 'Image size (X x Y x C) : {0} x {1} x 3\r\n'.format(*image_size)
+            for j, (x1, y1, x2, y2) in enumerate(random_boxes(rng, counts[i]).tolist()):
+                text += ('Bounding box for object {0} "PASperson" (Xmin, Ymin) - (Xmax, Ymax) : '
+                         '({1}, {2}) - ({3}, {4})\r\n').format(j + 1, x1, y1, x2, y2)
+            add_tar(archive, 'INRIAPerson/Train/annotations/{0}.txt'.format(name), text.encode('latin-1'))
+
+
+def afw_mat(names, rng, counts):
+    """
+        Returns: bytes of an AFW style anno.mat: a 4 x n cell array of object references
+                 to the file name, box cells and pose cells of every image
+    """
+    import h5py
+    buf = io.BytesIO()
+    with h5py.File(buf, 'w') as data:
+        anno = data.create_dataset('anno', (4, len(names)), dtype=h5py.ref_dtype)
+        refs = data.create_group('#refs#')
+        for i, name in enumerate(names):
+            # MATLAB chars are stored as a column of uint16 code units
+            anno[0, i] = refs.create_dataset('n{0}'.format(i), data=np.frombuffer(name.encode('utf-16-le'), dtype=np.uint16).reshape(-1, 1)).ref
+            box_cell = refs.create_dataset('b{0}'.format(i), (counts[i], 1), dtype=h5py.ref_dtype)
+            pose_cell = refs.create_dataset('p{0}'.format(i), (counts[i], 1), dtype=h5py.ref_dtype)
+            for j, (x1, y1, x2, y2) in enumerate(random_boxes(rng, counts[i]).tolist()):
+                # stored transposed: [[x1, x2], [y1, y2]]
+                box_cell[j, 0] = refs.create_dataset('b{0}_{1}'.format(i, j), data=np.array([[x1, x2], [y1, y2]], dtype=np.float64)).ref
+                pose_cell[j, 0] = refs.create_dataset('p{0}_{1}'.format(i, j), data=rng.uniform(-1, 1, (3, 1))).ref
+            anno[1, i] = box_cell.ref
+            anno[2, i] = pose_cell.ref
+            anno[3, i] = pose_cell.ref
+    return buf.getvalue()
+
+
+def afw(out, n, boxes, unique=False, seed=0):
+    """
+        Definition: AFW.zip with testimages/*.jpg and testimages/anno.mat.
+    """
+    rng = np.random.RandomState(seed)
+    images = Images('JPEG', unique, seed=seed)
+    names = ['{0:010d}_1.jpg'.format(i) for i in range(n)]
+    with zipfile.ZipFile(os.path.join(out, 'AFW.zip'), 'w') as archive:
+        for i, name in enumerate(names):
+            add_zip(archive, 'testimages/' + name, images.get(i))
+        add_zip(archive, 'testimages/anno.mat', afw_mat(names, rng, box_counts(rng, n, boxes)))
+
+
+def wiki(out, n, boxes, unique=False, seed=0):
+    """
+        Definition: wiki_crop.tar with two digit image folders and wiki.mat. IMDB-WIKI has one
+                    face per image, so boxes is not used; about one row in ten is unusable
+                    (no face, second face or missing gender) like in the real metadata.
+    """
+    from scipy.io import savemat
+    rng = np.random.RandomState(seed)
+    images = Images('JPEG', unique, seed=seed)
+    paths = ['{0:02d}/{1}_1950-01-01_2009.jpg'.format(i % 100, i) for i in range(n)]
+    full_path = np.empty((1, n), dtype=object)
+    name = np.empty((1, n), dtype=object)
+    face_location = np.empty((1, n), dtype=object)
+    for i, box in enumerate(random_boxes(rng, n).astype(np.float64)):
+        full_path[0, i] = np.array([paths[i]])
+        name[0, i] = np.array(['Person {0}'.format(i)])
+        face_location[0, i] = box.reshape(1, 4)
+    face_score = rng.uniform(0.5, 6.0, n)
+    face_score[rng.rand(n) < 0.05] = -np.inf
+    second_face_score = np.where(rng.rand(n) < 0.05, 1.0, np.nan)
+    gender = rng.randint(0, 2, n).astype(np.float64)
+    gender[rng.rand(n) < 0.02] = np.nan
+    meta = {'dob': (711858.0 + rng.randint(0, 20000, n)).reshape(1, n),
+            'photo_taken': np.full((1, n), 2009, dtype=np.uint16),
+            'full_path': full_path, 'gender': gender.reshape(1, n), 'name': name,
+            'face_location': face_location, 'face_score': face_score.reshape(1, n),
+            'second_face_score': second_face_score.reshape(1, n)}
+    buf = io.BytesIO()
+    savemat(buf, {'wiki': meta})
+    with tarfile.open(os.path.join(out, 'wiki_crop.tar'), 'w') as archive:
+        for i, path in enumerate(paths):
+            add_tar(archive, 'wiki_crop/' + path, images.get(i))
+        add_tar(archive, 'wiki_crop/wiki.mat', buf.getvalue())
+
+
+generators = {'WIDER': wider, 'INRIA': inria, 'AFW': afw, 'IMDB-WIKI': wiki}
+
+
+def generate(out, n, boxes=2, datasets=formats, unique=False, seed=0):
+    """
+        Definition: Writes the archives of the given datasets into out.
+    """
+    if not os.path.exists(out):
+        os.makedirs(out)
+    for name in datasets:
+        generators[name](out, n, boxes, unique, seed)
+
+
+def createParser():
+    ap = argparse.ArgumentParser(description="Write synthetic dataset archives")
+    ap.add_argument("--out", required = True, help = "Folder to write the archives to")
+    ap.add_argument("--images", type=int, default=1000, help = "Images per dataset")
+    ap.add_argument("--boxes", type=int, default=2, help = "Average boxes per image")
+    ap.add_argument("--formats", nargs="+", default=list(formats), choices=formats, help = "Archives to write")
+    ap.add_argument("--unique", action = "store_true", help = "Encode a different image for every file")
+    ap.add_argument("--seed", type=int, default=0, help = "Seed of boxes, metadata and pixels")
+    return ap
+
+
+def main():
+    args = createParser().parse_args(sys.argv[1:])
+    generate(args.out, args.images, args.boxes, args.formats, args.unique, args.seed)
+
+if __name__ == '__main__':
+    main()
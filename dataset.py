@@ -0,0 +1,244 @@
+# Import necessary libraries
+import numpy as np
+
+###########################################################
+##########       Columnar bounding box dataset   ##########
+###########################################################
+
+# All boxes of a dataset are kept in one contiguous (N, 4) array, grouped by
+# image, with parallel per-box columns (image index, class id, gender, age,
+# pose, face score, plus any dataset specific per-box attributes such as the
+# WIDER blur/occlusion flags). Missing attributes are NaN.
+# Sample:
+#   dataset = BoxDataset.from_records(records)
+#   dataset = dataset.filter(dataset.class_mask('face'))
+#   cxcywh = dataset.boxes_as('cxcywh')
+#   for record in dataset: ...  # records as written by the converters
+
+box_formats = ('xyxy', 'xywh', 'cxcywh')
+# images per BoxDataset built by normalised_records
+chunk_size = 1000
+# record keys with a dedicated column; any other numeric key becomes an attribute column
+record_keys = ('class_name', 'bounding_box', 'gender', 'age', 'pose', 'face_score')
+
+
+def convert_boxes(boxes, src='xyxy', dst='xyxy'):
+    """
+        Definition: Converts an (N, 4) box array between xyxy, xywh and cxcywh.
+        Returns: float64 (N, 4) array
+    """
+    if src not in box_formats or dst not in box_formats:
+        raise ValueError("Unknown box format: {0} -> {1}".format(src, dst))
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if src == dst:
+        return boxes.copy()
+    # to xyxy
+    if src == 'xywh':
+        xy = boxes[:, :2]
+        xyxy = np.hstack((xy, xy + boxes[:, 2:]))
+    elif src == 'cxcywh':
+        half = boxes[:, 2:] / 2.0
+        xyxy = np.hstack((boxes[:, :2] - half, boxes[:, :2] + half))
+    else:
+        xyxy = boxes
+    # from xyxy
+    if dst == 'xywh':
+        return np.hstack((xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]))
+    if dst == 'cxcywh':
+        return np.hstack(((xyxy[:, :2] + xyxy[:, 2:]) / 2.0, xyxy[:, 2:] - xyxy[:, :2]))
+    return xyxy.copy()
+
+
+class BoxDataset(object):
+    """
+        Definition: In-memory dataset holding every box in contiguous NumPy columns.
+    """
+    def __init__(self, filenames, boxes, image_index, class_id, class_names,
+                 gender=None, age=None, pose=None, face_score=None, attributes=None):
+        n = len(image_index)
+        self.filenames = list(filenames)
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(n, 4)
+        self.image_index = np.asarray(image_index, dtype=np.int64)
+        self.class_id = np.asarray(class_id, dtype=np.int16)
+        self.class_names = list(class_names)
+        self.gender = self._column(gender, n)
+        self.age = self._column(age, n)
+        self.pose = self._column(pose, n, 3)
+        self.face_score = self._column(face_score, n)
+        self.attributes = dict((name, self._column(values, n)) for name, values in (attributes or {}).items())
+        order = np.argsort(self.image_index, kind='stable')
+        if np.any(order != np.arange(n)):
+            for name in ('boxes', 'image_index', 'class_id', 'gender', 'age', 'pose', 'face_score'):
+                setattr(self, name, getattr(self, name)[order])
+            self.attributes = dict((name, values[order]) for name, values in self.attributes.items())
+        # boxes of image i are offsets[i]:offsets[i + 1]
+        self.offsets = np.searchsorted(self.image_index, np.arange(len(self.filenames) + 1))
+
+    @staticmethod
+    def _column(values, n, width=None):
+        shape = (n,) if width is None else (n, width)
+        if values is None:
+            return np.full(shape, np.nan)
+        return np.asarray(values, dtype=np.float64).reshape(shape)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+            Definition: Builds the columns from converter image records.
+        """
+        filenames = []
+        boxes, image_index, class_id = [], [], []
+        gender, age, pose, face_score = [], [], [], []
+        extras = []
+        class_names = {}
+        nan3 = [np.nan] * 3
+        for record in records:
+            i = len(filenames)
+            filenames.append(record['filename'])
+            for obj in record['objects']:
+                boxes.append(obj['bounding_box'])
+                image_index.append(i)
+                class_id.append(class_names.setdefault(obj['class_name'], len(class_names)))
+                g = obj.get('gender', np.nan)
+                gender.append(np.nan if g is None else g)
+                a = obj.get('age', np.nan)
+                age.append(np.nan if a is None else a)
+                pose.append(obj.get('pose', nan3))
+                face_score.append(obj.get('face_score', np.nan))
+                extras.append(dict((k, v) for k, v in obj.items() if k not in record_keys))
+        names = sorted(class_names, key=class_names.get)
+        attributes = {}
+        for name in sorted(set(k for extra in extras for k in extra)):
+            attributes[name] = [np.nan if extra.get(name) is None else extra[name] for extra in extras]
+        return cls(filenames, np.array(boxes, dtype=np.int32).reshape(-1, 4), image_index, class_id, names,
+                   gender, age, pose, face_score, attributes)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def box_count(self):
+        return len(self.image_index)
+
+    def image_slice(self, i):
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def class_mask(self, class_name):
+        if class_name not in self.class_names:
+            return np.zeros(self.box_count, dtype=bool)
+        return self.class_id == self.class_names.index(class_name)
+
+    def filter(self, mask, drop_empty=False):
+        """
+            Definition: Keeps boxes where mask is True. With drop_empty images left
+            without boxes are removed and the image index is renumbered.
+            Returns: new BoxDataset
+        """
+        mask = np.asarray(mask, dtype=bool)
+        filenames = self.filenames
+        image_index = self.image_index[mask]
+        if drop_empty:
+            keep = np.zeros(len(self.filenames), dtype=bool)
+            keep[image_index] = True
+            filenames = [f for f, k in zip(self.filenames, keep) if k]
+            image_index = (np.cumsum(keep) - 1)[image_index]
+        return BoxDataset(filenames, self.boxes[mask], image_index, self.class_id[mask], self.class_names,
+                          self.gender[mask], self.age[mask], self.pose[mask], self.face_score[mask],
+                          dict((name, values[mask]) for name, values in self.attributes.items()))
+
+    def select_images(self, mask):
+        """
+            Definition: Keeps the images where the per-image mask is True, with their boxes.
+            Returns: new BoxDataset
+        """
+        mask = np.asarray(mask, dtype=bool)
+        dataset = self.filter(mask[self.image_index])
+        remap = np.cumsum(mask) - 1
+        return BoxDataset([f for f, k in zip(self.filenames, mask) if k], dataset.boxes, remap[dataset.image_index],
+                          dataset.class_id, self.class_names, dataset.gender, dataset.age, dataset.pose,
+                          dataset.face_score, dataset.attributes)
+
+    def clip(self, widths, heights):
+        """
+            Definition: Clips xyxy boxes to the image bounds; widths and heights are
+            per-image arrays (or scalars).
+            Returns: new BoxDataset
+        """
+        n = len(self.filenames)
+        w = np.broadcast_to(np.asarray(widths, dtype=self.boxes.dtype), (n,))[self.image_index]
+        h = np.broadcast_to(np.asarray(heights, dtype=self.boxes.dtype), (n,))[self.image_index]
+        boxes = self.boxes.copy()
+        np.clip(boxes[:, 0], 0, w, out=boxes[:, 0])
+        np.clip(boxes[:, 2], 0, w, out=boxes[:, 2])
+        np.clip(boxes[:, 1], 0, h, out=boxes[:, 1])
+        np.clip(boxes[:, 3], 0, h, out=boxes[:, 3])
+        return BoxDataset(self.filenames, boxes, self.image_index, self.class_id, self.class_names,
+                          self.gender, self.age, self.pose, self.face_score, self.attributes)
+
+    def boxes_as(self, fmt='xyxy'):
+        return convert_boxes(self.boxes, 'xyxy', fmt)
+
+    def image_annotations(self, i):
+        """
+            Definition: Columns of one image, in the shape the VOC exporter expects.
+            Returns: labels, coords, genders, ages (genders/ages empty when not annotated)
+        """
+        s = self.image_slice(i)
+        labels = [self.class_names[c] for c in self.class_id[s]]
+        coords = self.boxes[s].tolist()
+        genders, ages = [], []
+        for g, a in zip(self.gender[s], self.age[s]):
+            if not np.isnan(a):
+                genders.append(None if np.isnan(g) else float(g))
+                ages.append(_number(a))
+        return labels, coords, genders, ages
+
+    def record(self, i):
+        """
+            Definition: Rebuilds the converter record of image i.
+        """
+        s = self.image_slice(i)
+        objects = []
+        for j in range(s.start, s.stop):
+            obj = {'class_name': self.class_names[self.class_id[j]], 'bounding_box': self.boxes[j].tolist()}
+            if not np.isnan(self.age[j]):
+                obj['gender'] = None if np.isnan(self.gender[j]) else float(self.gender[j])
+                obj['age'] = _number(self.age[j])
+            if not np.isnan(self.pose[j, 0]):
+                obj['pose'] = self.pose[j].tolist()
+            if not np.isnan(self.face_score[j]):
+                obj['face_score'] = float(self.face_score[j])
+            for name, values in self.attributes.items():
+                if not np.isnan(values[j]):
+                    obj[name] = _number(values[j])
+            objects.append(obj)
+        return {'filename': self.filenames[i], 'objects': objects}
+
+    def __iter__(self):
+        for i in range(len(self.filenames)):
+            yield self.record(i)
+
+
+def normalised_records(records, chunk_size=chunk_size):
+    """
+        Definition: Streams converter records in the form a BoxDataset gives them back
+                    (the form the annotation store holds), building the columns chunk_size
+                    images at a time so memory does not grow with the dataset.
+        Returns: generator of image records
+    """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            for normalised in BoxDataset.from_records(chunk):
+                yield normalised
+            chunk = []
+    if chunk:
+        for normalised in BoxDataset.from_records(chunk):
+            yield normalised
+
+
+def _number(value):
+    # ages and attribute flags are whole numbers; keep them as ints in records and XML
+    value = float(value)
+    return int(value) if value.is_integer() else value
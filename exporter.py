@@ -0,0 +1,104 @@
+# Import necessary libraries
+import os, argparse
+import multiprocessing
+from Parser import *
+from registry import get_reader, dataset_names
+from splitter import Splitter
+from transcode import Transcoder, default_quality
+
+###########################################################
+##########     Shared parts of the exporters     ##########
+###########################################################
+
+# Base of the COCO and YOLO exporters: finds the dataset images of the
+# converted records, assigns each image a split from the seeded file name
+# hash (the same assignment as the VOC export), runs .png
+# sources through the transcode cache and spreads per-image work over a
+# process pool in bounded batches, so memory does not grow with the dataset.
+# Sample:
+#   class JsonToCoco(Exporter): ...
+#   JsonToCoco('AFW').coco(workers=4)
+
+batch_size = 512
+
+
+class Exporter(Parser):
+    """
+        Definition: Converted records of one dataset with their images and splits.
+    """
+    def __init__(self, dataset, placement=default_strategy, quality=default_quality, splitter=None):
+        reader = get_reader(str(dataset))
+        self.json_dir = reader.json_dir
+        self.images_dir = reader.images_dir
+        self.source_ext = reader.image_ext
+        self.placement = placement
+        self.transcoder = Transcoder(quality=quality)
+        self.splitter = Splitter() if splitter is None else splitter
+
+    def source(self, filename):
+        return self.images_dir + filename.split(".")[0] + self.source_ext
+
+    def records(self):
+        """
+            Definition: Streams the records of the annotation store whose image exists.
+            Returns: generator of (record, source image path)
+        """
+        for record in AnnotationStore(self.json_dir):
+            src = self.source(record['filename'])
+            if os.path.isfile(src):
+                yield record, src
+
+    def jpgs(self, workers=1):
+        """
+            Definition: Transcodes .png sources once up front (cached by content hash).
+            Returns: dict of source path -> .jpg path (empty for .jpg datasets)
+        """
+        if self.source_ext == ".jpg":
+            return {}
+        return self.transcoder.run([src for record, src in self.records()], workers)
+
+    def split(self, filename):
+        return self.splitter.assign(filename)
+
+
+def batches(items, size=batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_batches(func, tasks, workers=1):
+    """
+        Definition: Applies func to every task, on a process pool when workers > 1.
+                    Only one batch of tasks is in flight at a time.
+        Returns: generator of results, in task order
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for batch in batches(tasks):
+            for result in pool.map(func, batch, chunksize=max(1, len(batch) // (4 * workers))):
+                yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def createParser(description):
+    ap = argparse.ArgumentParser(description=description)
+    ap.add_argument("--dataset", required = True, choices=dataset_names(), help = "Converted dataset to export")
+    ap.add_argument("--workers", type=int, default=1, required = False, help = "Number of processes exporting images")
+    ap.add_argument("--placement", default=default_strategy, choices=strategies, required = False, help = "How images are placed: reflink, hardlink, symlink, copy or auto")
+    ap.add_argument("--quality", type=int, default=default_quality, required = False, help = "JPEG quality for transcoded .png images")
+    ap.add_argument("--seed", type=int, default=0, required = False, help = "Seed of the hash based train/val/test split")
+    ap.add_argument("--force", action = "store_true", help = "Remove the previous export first")
+    add_instrument_arguments(ap)
+    return ap
@@ -0,0 +1,158 @@
+# Import necessary libraries
+import os, json
+import multiprocessing
+from manifest import file_hash
+
+###########################################################
+##########     Cached content/perceptual hashes  ##########
+###########################################################
+
+# Content hashes (sha1 of the file) find byte identical images, perceptual
+# hashes (64 bit difference hash of a 9x8 grayscale thumbnail) also find
+# re-encoded or resized copies. Hashes are computed on a process pool and
+# kept in an on-disk cache keyed by path, mtime and file size.
+# Sample:
+#   hashes = HashCache()
+#   dhashes = hashes.get(filenames, 'perceptual', workers=4)
+#   groups = near_duplicates(dhashes, max_distance=4)
+#   hashes.save()
+
+default_cache_file = 'datasets/image_hashes.json'
+kinds = ('content', 'perceptual')
+
+
+def dhash(filename):
+    """
+        Definition: Difference hash: one bit per horizontally adjacent pixel pair of a
+                    9x8 grayscale thumbnail, set where brightness increases.
+        Returns: int, 64 bits
+    """
+    from PIL import Image
+    im = Image.open(filename)
+    im.draft('L', (64, 64))
+    pixels = list(im.convert('L').resize((9, 8), Image.BILINEAR).getdata())
+    im.close()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return value
+
+
+def compute(filename, kind):
+    return file_hash(filename) if kind == 'content' else dhash(filename)
+
+
+def _compute(args):
+    filename, kind = args
+    return filename, compute(filename, kind)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def near_duplicates(hashes, max_distance=0, bits=64):
+    """
+        Definition: Groups items whose perceptual hashes differ in at most max_distance bits.
+                    The hash is cut into max_distance + 1 bands; two hashes that close agree
+                    on at least one band, so only items sharing a band are compared.
+        Returns: dict of item -> first item (in the given order) of its group
+    """
+    items = list(hashes)
+    first = {}
+    if max_distance <= 0:
+        seen = {}
+        for item in items:
+            first[item] = seen.setdefault(hashes[item], item)
+        return first
+    bands = min(max_distance + 1, bits)
+    width = bits // bands
+    buckets = [{} for band in range(bands)]
+    for item in items:
+        value = hashes[item]
+        keys = []
+        for band in range(bands):
+            # the last band takes the remaining bits
+            shift = band * width
+            mask = (1 << (bits - shift if band == bands - 1 else width)) - 1
+            keys.append((value >> shift) & mask)
+        match = None
+        for band, key in enumerate(keys):
+            for other in buckets[band].get(key, ()):
+                if hamming(value, hashes[other]) <= max_distance:
+                    match = first[other]
+                    break
+            if match is not None:
+                break
+        first[item] = item if match is None else match
+        if match is None:
+            # only group leaders are indexed, so groups do not chain
+            for band, key in enumerate(keys):
+                buckets[band].setdefault(key, []).append(item)
+    return first
+
+
+class HashCache(object):
+    """
+        Definition: Persistent cache of image hashes keyed by path + mtime + size.
+    """
+    def __init__(self, cache_file=default_cache_file):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.changed = False
+        if cache_file and os.path.isfile(cache_file):
+            with open(cache_file) as f:
+                try:
+                    self.entries = json.load(f)
+                except ValueError:
+                    self.entries = {}
+
+    def get(self, filenames, kind='content', workers=1):
+        """
+            Definition: Hashes of the files, computing only those missing or changed,
+                        in parallel when workers > 1.
+            Returns: dict of filename -> hash
+        """
+        if kind not in kinds:
+            raise ValueError("Unknown hash kind: {0}".format(kind))
+        hashes, missing, stats = {}, [], {}
+        for filename in filenames:
+            st = os.stat(filename)
+            stats[filename] = (st.st_mtime_ns, st.st_size)
+            entry = self.entries.get(os.path.abspath(filename))
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size and kind in entry[2]:
+                hashes[filename] = entry[2][kind]
+            else:
+                missing.append(filename)
+        if workers > 1 and len(missing) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                computed = list(pool.imap_unordered(_compute, [(f, kind) for f in missing], chunksize=32))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            computed = [(f, compute(f, kind)) for f in missing]
+        for filename, value in computed:
+            key = os.path.abspath(filename)
+            entry = self.entries.get(key)
+            if entry is None or (entry[0], entry[1]) != stats[filename]:
+                entry = list(stats[filename]) + [{}]
+                self.entries[key] = entry
+            entry[2][kind] = value
+            hashes[filename] = value
+            self.changed = True
+        return hashes
+
+    def save(self):
+        if not self.changed or not self.cache_file:
+            return
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp = self.cache_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.cache_file)
+        self.changed = False
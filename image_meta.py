@@ -0,0 +1,118 @@
+# Import necessary libraries
+import os, json
+import struct
+
+###########################################################
+##########     Header-only image size probing    ##########
+###########################################################
+
+# Reads width, height and channels of .jpg/.png images from their headers
+# without decoding pixels. Results are kept in an on-disk cache keyed by
+# path, mtime and file size, so repeat runs do not even open the images.
+# Sample:
+#   sizes = SizeCache('datasets/image_sizes.json')
+#   w, h, c = sizes.get('datasets/AFW/afw_0001.jpg')
+#   sizes.save()
+
+default_cache_file = 'datasets/image_sizes.json'
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# PNG color type -> channels
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+# JPEG start-of-frame markers (C4, C8 and CC are DHT, JPG and DAC)
+JPEG_SOF = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+
+
+def _png_size(f):
+    f.seek(8)
+    length, chunk = struct.unpack('>I4s', f.read(8))
+    if chunk != b'IHDR':
+        return None
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', f.read(10))
+    return width, height, PNG_CHANNELS.get(color_type, 3)
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        # skip fill bytes before the marker
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = ord(byte)
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in JPEG_SOF:
+            precision, height, width, channels = struct.unpack('>BHHB', f.read(6))
+            return width, height, channels
+        f.seek(length - 2, 1)
+
+
+def read_size(filename):
+    """
+        Definition: Reads image dimensions from the JPEG SOF or PNG IHDR header.
+        Falls back to PIL (which also only reads the header) for other formats.
+        Returns: (width, height, channels)
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(8)
+        size = None
+        try:
+            if head == PNG_SIGNATURE:
+                size = _png_size(f)
+            elif head[:2] == b'\xff\xd8':
+                size = _jpeg_size(f)
+        except struct.error:
+            size = None
+    if size is None:
+        from PIL import Image
+        img = Image.open(filename)
+        size = img.size + (len(img.getbands()),)
+        img.close()
+    return size
+
+
+class SizeCache(object):
+    """
+        Definition: Persistent cache of image dimensions keyed by path + mtime + size.
+    """
+    def __init__(self, cache_file=default_cache_file):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.changed = False
+        if cache_file and os.path.isfile(cache_file):
+            with open(cache_file) as f:
+                try:
+                    self.entries = json.load(f)
+                except ValueError:
+                    self.entries = {}
+
+    def get(self, filename):
+        """
+            Definition: Image dimensions, read from the cache while the file is unchanged.
+            Returns: (width, height, channels)
+        """
+        st = os.stat(filename)
+        key = os.path.abspath(filename)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return tuple(entry[2:])
+        size = read_size(filename)
+        self.entries[key] = [st.st_mtime_ns, st.st_size] + list(size)
+        self.changed = True
+        return size
+
+    def save(self):
+        if not self.changed or not self.cache_file:
+            return
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp = self.cache_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.cache_file)
+        self.changed = False
@@ -1,6 +1,7 @@
-import sys
-from scipy.io import loadmat
-from datetime import datetime
+import sys, io
+import numpy as np
+from lazy import lazy_import
+scipy_io = lazy_import('scipy.io')
 from Parser import *
 
 python_version = sys.version_info.major
@@ -14,6 +15,10 @@ python_version = sys.version_info.major
 #you will extract files from wich.
 #Sample: python imdb_wiki_to_json.py --subfolder  wiki_crop/
 #By defoult subfolder path for images & annotations extraction: "wiki_crop/"
+#Add --stream to read wiki.mat straight from the archive without extracting it first.
+#Add --db imdb to convert imdb_crop.tar / imdb.mat instead of wiki.
+#Rows without a face, with a second face or with an age outside [--min_age, --max_age]
+#are dropped; see --min_face_score and --keep_multiple_faces.
 
 dataset_archive = "wiki_crop.tar"
 imgs_and_anns_subfolder = "wiki_crop/"
@@ -22,74 +27,123 @@ json_dir = 'datasets/JSON_IMDB-WIKI/'
 annotations_file = 'datasets/IMDB-WIKI/wiki.mat'
 directories = [imgs_and_anns_destination, json_dir]
 db = "wiki"
+# db -> (archive, images & annotations subfolder, metadata file)
+db_files = {"wiki": ("wiki_crop.tar", "wiki_crop/", 'datasets/IMDB-WIKI/wiki.mat'),
+            "imdb": ("imdb_crop.tar", "imdb_crop/", 'datasets/IMDB-WIKI/imdb.mat')}
 subdir_count = 100
-subdir = []
 
+@register('IMDB-WIKI')
 class ImdbWikiToJson(Parser):
+
+    root = imgs_and_anns_destination
+    images_dir = imgs_and_anns_destination
+    json_dir = json_dir
+    directories = directories
+    subfolders = (None, None, imgs_and_anns_subfolder)
     
-    def __init__(self):
-        self.objects = []   
-        self.object_info = {}
-        self.coords = []
+    def __init__(self, min_face_score=None, keep_multiple_faces=False, min_age=0, max_age=100):
+        # rows are kept when a face was found (finite face_score), the score reaches
+        # min_face_score, there is no second face and the age is in [min_age, max_age]
+        self.min_face_score = min_face_score
+        self.keep_multiple_faces = keep_multiple_faces
+        self.min_age = min_age
+        self.max_age = max_age
         
     def calc_age(self, taken, dob):
-        birth = datetime.fromordinal(max(int(dob) - 366, 1))
+        """
+            Definition: Ages for whole arrays of photo years and Matlab serial birth dates.
+        """
+        # Matlab serial date number -> proleptic Gregorian ordinal -> numpy day (epoch ordinal 719163)
+        ordinal = np.maximum(np.asarray(dob, dtype=np.float64).astype(np.int64) - 366, 1)
+        birth = (ordinal - 719163).astype('datetime64[D]')
+        year = birth.astype('datetime64[Y]').astype(np.int64) + 1970
+        month = birth.astype('datetime64[M]').astype(np.int64) % 12 + 1
         # assume the photo was taken in the middle of the year
-        if birth.month < 7:
-            return taken - birth.year
-        else:
-            return taken - birth.year - 1
+        return np.asarray(taken, dtype=np.int64) - year - (month >= 7)
+
+    def row_mask(self, face_score, second_face_score, age):
+        mask = np.isfinite(face_score)
+        if self.min_face_score is not None:
+            mask &= face_score >= self.min_face_score
+        if not self.keep_multiple_faces:
+            mask &= np.isnan(second_face_score)
+        mask &= (age >= self.min_age) & (age <= self.max_age)
+        return mask
         
-    def parse(self):
+    def parse(self, source=None):
         """
-            Definition: Make annotations directory for wiki annotations and populate it with separate ann files.
-            Returns: None
+            Definition: Converts wiki/imdb .mat metadata with array operations. Unusable rows are
+                        masked out before any per-image object is built.
+                        source is an optional file object to read the .mat from instead of annotations_file.
+            Returns: generator of image records, built only for the kept rows
         """
-        meta = loadmat(annotations_file)
-        full_path = meta[db][0, 0]["full_path"][0]
-        dob = meta[db][0, 0]["dob"][0]  # Matlab serial date number
-        gender = meta[db][0, 0]["gender"][0]
-        name = meta[db][0, 0]["name"][0]
-        face_location = meta[db][0, 0]["face_location"][0]
-        photo_taken = meta[db][0, 0]["photo_taken"][0]  # year
-        face_score = meta[db][0, 0]["face_score"][0]
-        second_face_score = meta[db][0, 0]["second_face_score"][0]
-        age = [self.calc_age(photo_taken[i], dob[i]) for i in range(len(dob))]
-        ind = -1
-        
-        for i in range(len(dob)):
-            self.object_info['filename'] = str(full_path[i]).split("/")[1].split("'")[0]
-            self.object_info['objects'] = []
-            self.face_info = {'class_name':'face'}
-            for row in face_location[i]:
-                for j in row:
-                    self.coords.append(int(j))
-                self.face_info['bounding_box'] = self.coords
-                self.coords = []
+        meta = scipy_io.loadmat(annotations_file if source is None else source, variable_names=[db])
+        fields = meta.pop(db)[0, 0]
+        del meta
+        full_path = fields["full_path"][0]
+        dob = fields["dob"][0]  # Matlab serial date number
+        gender = fields["gender"][0].astype(np.float64)
+        face_location = fields["face_location"][0]
+        photo_taken = fields["photo_taken"][0]  # year
+        face_score = fields["face_score"][0].astype(np.float64)
+        second_face_score = fields["second_face_score"][0].astype(np.float64)
+        # drop the struct so name/celeb columns of imdb.mat can be freed
+        del fields
+        age = self.calc_age(photo_taken, dob)
+        rows = np.flatnonzero(self.row_mask(face_score, second_face_score, age))
+        print ('Kept {0} of {1} rows'.format(len(rows), len(dob)))
+        for i in rows.tolist():
+            yield {'filename': os.path.basename(str(full_path[i][0])),
+                   'objects': [{'class_name': 'face',
+                                'bounding_box': [int(v) for v in face_location[i].ravel()[:4]],
+                                'gender': float(gender[i]), 'age': int(age[i]), 'face_score': float(face_score[i])}]}
+
+    @staticmethod
+    def add_arguments(ap):
+        ap.add_argument("--db", default=db, choices=sorted(db_files), help = "Metadata to convert: wiki or imdb")
+        ap.add_argument("--min_face_score", type=float, default=None, help = "Drop faces scored below this")
+        ap.add_argument("--keep_multiple_faces", action = "store_true", help = "Keep images where a second face was detected")
+        ap.add_argument("--min_age", type=int, default=0, help = "Drop ages below this")
+        ap.add_argument("--max_age", type=int, default=100, help = "Drop ages above this")
+
+    @classmethod
+    def from_namespace(cls, namespace):
+        if namespace.db != db:
+            if namespace.imgs_and_anns_subfolder == imgs_and_anns_subfolder:
+                namespace.imgs_and_anns_subfolder = db_files[namespace.db][1]
+            select_db(namespace.db)
+        return cls(namespace.min_face_score, namespace.keep_multiple_faces, namespace.min_age, namespace.max_age)
+
+    def fetch(self, namespace, manifest):
+        """
+            Definition: Puts the images in a single folder (streamed or extracted).
+            Returns: (.mat key, its stamp with the filter options, callable returning the record generator)
+        """
+        key = os.path.basename(annotations_file)
+        # filter settings change the output as much as the metadata does
+        options = [self.min_face_score, self.keep_multiple_faces, self.min_age, self.max_age]
+        if namespace.stream:
+            anns = self.stream_extract(dataset_archive, namespace.imgs_and_anns_subfolder, imgs_and_anns_destination, ann_exts=('.mat',), manifest=manifest)
+            data = anns[key]
+            return key, {'sha1': data_hash(data), 'options': options}, lambda: self.parse(io.BytesIO(data))
+        self.extract(dataset_archive, namespace.imgs_and_anns_subfolder, imgs_and_anns_destination, namespace.extract_workers, manifest)
+        #Copy images to single folder and remove old folders
+        for i in range(subdir_count):
+            self.copy("{0:02d}/".format(i), imgs_and_anns_destination, None, namespace.placement)
+        stamp = file_stamp(annotations_file, True)
+        stamp['options'] = options
+        return key, stamp, self.parse
+
+def select_db(name):
+    """
+        Definition: Points the module paths at the wiki or imdb part of IMDB-WIKI.
+    """
+    global db, dataset_archive, imgs_and_anns_subfolder, annotations_file
+    db = name
+    dataset_archive, imgs_and_anns_subfolder, annotations_file = db_files[name]
 
-            self.face_info['gender'] = gender[i]
-            self.face_info['age'] = age[i]
-            self.object_info['objects'].append(self.face_info)
-                
-            self.objects.append(self.object_info.copy())
-                
-        return self.objects
-    
 def main():
-    namespace = Parser.createParser (None, None, imgs_and_anns_subfolder)
-    imdb_wiki = ImdbWikiToJson()
-    #make imdb-wiki directories
-    imdb_wiki.make_directories(directories)
-    imdb_wiki.extract(dataset_archive, namespace.imgs_and_anns_subfolder, imgs_and_anns_destination)
-    #Copy images to single folder and remove old folders
-    for i in range(subdir_count):
-        if i < 10:
-            subdir.append("0"+str(i)+"/")
-        if i >= 10:
-            subdir.append(str(i)+"/")
-        imdb_wiki.copy(subdir[i], imgs_and_anns_destination, None)
-    # make json directory
-    imdb_wiki.populate_json_ann(json_dir, imdb_wiki.parse())
+    ImdbWikiToJson.to_json()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
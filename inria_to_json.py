@@ -1,10 +1,7 @@
 # Import necessary libraries
-import os, sys
-import numpy as np
+import os, sys, re
+import hashlib
 from Parser import *
-from PIL import Image
-from scipy.io import loadmat
-from datetime import datetime
 
 python_version = sys.version_info.major
 
@@ -19,6 +16,7 @@ python_version = sys.version_info.major
 # Sample: python InriaToJson.py --imgs_subfolder INRIAPerson/Train/pos/
 # By defoult subfolder path for images extraction: "INRIAPerson/Train/pos/"
 #for annotations extraction: "INRIAPerson/Train/annotations/"
+# Add --stream to read annotations straight from the archive in the same pass as the images.
     
 dataset_archive = "INRIAPerson.tar"
 imgs_subfolder = "INRIAPerson/Train/pos/"
@@ -28,51 +26,77 @@ anns_destination = 'datasets/INRIA/annotations/'
 json_dir = 'datasets/JSON_INRIA/'
 directories = [json_dir,imgs_destination, anns_destination]
 
+@register('INRIA')
 class InriaToJson(Parser):
+
+    root = 'datasets/INRIA/'
+    images_dir = imgs_destination
+    # INRIA ships .png images; the VOC export transcodes them to .jpg
+    image_ext = ".png"
+    json_dir = json_dir
+    directories = directories
+    subfolders = (imgs_subfolder, anns_subfolder, None)
    
-    def parse(self):
+    def read_annotations(self, names=None):
+        """
+        Definition: Reads extracted label files from anns_destination one at a time.
+        Returns: generator of (label filename, file contents)
+        """
+        for f in os.listdir(anns_destination) if names is None else names:
+            with open(anns_destination+f, "rb") as lfile:
+                yield f, lfile.read()
+
+    def annotations_stamp(self, annotations):
+        """
+        Definition: One sha1 over all (label filename, contents) pairs, given in name order.
+        """
+        sha1 = hashlib.sha1()
+        for f, data in annotations:
+            sha1.update(f.encode("utf-8") + b"\0" + data)
+        return {'sha1': sha1.hexdigest()}
+
+    def parse(self, source=None):
         """
         Definition: Parses label file to extract label and bounding box
-        coordintates.
+        coordintates. source is an optional dict of label filename -> contents,
+        as returned by stream_extract; by default the extracted files are read lazily.
+        Returns: generator of image records, one per label file
         """
-        objects = []   
-        object_info = {}
-        coords = []
-        for f in os.listdir(anns_destination):
-            object_info['filename'] = f.split(".")[0]+".jpg"
-            object_info['objects'] = []
+        for f, data in (self.read_annotations() if source is None else source.items()):
+            object_info = {'filename': f.split(".")[0]+".jpg", 'objects': []}
 
-            with open(anns_destination+f) as f:
-                data = f.read()
+            data = data.decode("latin-1")
 
-            import re
             objs = re.findall('\(\d+, \d+\)[\s\-]+\(\d+, \d+\)', data)
-            num_objs = len(objs)
-            boxes = np.zeros((num_objs, 4), dtype=np.uint16)
-            # Load object bounding boxes into a data frame.
-            for ix,  obj in enumerate(objs):
-                # Make pixel indexes 0-based
+            for obj in objs:
                 coor = re.findall('\d+', obj)
                 x1 = int(coor[0])
                 y1 = int(coor[1])
                 x2 = int(coor[2])
                 y2 = int(coor[3])
 
-                tmp = [x1,y1,x2,y2]
-                coords.append(tmp)
                 person_info = {'class_name':'Person'}
-                person_info ['bounding_box'] = tmp
+                person_info ['bounding_box'] = [x1,y1,x2,y2]
                 object_info['objects'].append(person_info)
-                objects.append(object_info.copy())
-                tmp = []
-        return objects
+            yield object_info
+    def fetch(self, namespace, manifest):
+        """
+            Definition: Puts the images in place (streamed or extracted) and reads the label files.
+            Returns: ("annotations", stamp of all label files, callable returning the record generator)
+        """
+        # the label files are small, so one hash over all of them stamps the store
+        if namespace.stream:
+            anns = self.stream_extract(dataset_archive, namespace.imgs_subfolder, imgs_destination, namespace.anns_subfolder, ann_exts=('.txt',), manifest=manifest)
+            return "annotations", self.annotations_stamp(sorted(anns.items())), lambda: self.parse(anns)
+        # images and label files come out of one read of the tar
+        self.extract_all(dataset_archive, [(namespace.imgs_subfolder, imgs_destination),
+                                           (namespace.anns_subfolder, anns_destination)], namespace.extract_workers, manifest)
+        # extracted label files are hashed and parsed one at a time rather than held in memory
+        stamp = self.annotations_stamp(self.read_annotations(sorted(os.listdir(anns_destination))))
+        return "annotations", stamp, self.parse
+
 def main():
-    inria =  InriaToJson()
-    namespace = Parser.createParser (imgs_subfolder, anns_subfolder, None)
-    inria.make_directories(directories)
-    inria.extract(dataset_archive, namespace.imgs_subfolder, imgs_destination)
-    inria.extract(dataset_archive, namespace.anns_subfolder, anns_destination)
-    inria.populate_json_ann(json_dir,inria.parse())
+    InriaToJson.to_json()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,165 @@
+# Import necessary libraries
+import os, sys, json, time
+import contextlib
+
+###########################################################
+##########      Per-stage run instrumentation    ##########
+###########################################################
+
+# Stages of a conversion (extract, copy, parse, store writing, VOC export, ...)
+# are wrapped in stage(); each records wall time, item count and rate, bytes
+# read and written (Linux /proc/self/io, which includes finished worker
+# processes) and the peak resident set size reached so far. session() wraps
+# a whole command: with --report FILE the stages are written there as JSON and
+# summarised on the console, --profile runs cProfile over the command and
+# --tracemalloc adds the peak of traced Python allocations per stage.
+# Sample:
+#   with stage('extract', archive) as s:
+#       for member in members:
+#           ...
+#           s.items += 1
+#   with session(namespace):
+#       main_work()
+
+stages = []
+_depth = [0]
+_started = [time.time()]
+
+
+def io_counters():
+    """
+        Returns: (bytes read, bytes written) by this process and its reaped children, or (None, None)
+    """
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':', 1) for line in f.read().splitlines() if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss_mb():
+    """
+        Returns: highest resident set size of this process or any reaped child so far, in MB
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss of this process carries over the peak of whatever process started it,
+    # VmHWM is this program's own; both are kilobytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open('/proc/self/status') as f:
+            peak = int([line for line in f if line.startswith('VmHWM:')][0].split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+def _tracing():
+    tracemalloc = sys.modules.get('tracemalloc')
+    return tracemalloc if tracemalloc is not None and tracemalloc.is_tracing() else None
+
+
+class Stage(object):
+    """
+        Definition: Measurements of one stage; items, bytes_read and bytes_written can
+                    be added to by the code being measured.
+    """
+    def __init__(self, name, detail=None):
+        self.name = name
+        self.detail = detail
+        self.items = 0
+
+    def __enter__(self):
+        self.depth = _depth[0]
+        _depth[0] += 1
+        tracemalloc = _tracing()
+        if tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.io = io_counters()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.time() - self.start
+        _depth[0] -= 1
+        read, written = io_counters()
+        entry = {'stage': self.name, 'detail': self.detail, 'depth': self.depth,
+                 'start_s': round(self.start - _started[0], 4), 'wall_s': round(wall, 4),
+                 'items': self.items, 'items_per_s': round(self.items / wall, 1) if wall > 0 else None,
+                 'bytes_read': read - self.io[0] if read is not None else None,
+                 'bytes_written': written - self.io[1] if written is not None else None,
+                 'peak_rss_mb': peak_rss_mb()}
+        tracemalloc = _tracing()
+        if tracemalloc is not None:
+            entry['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1048576.0, 2)
+        if exc_type is not None:
+            entry['error'] = exc_type.__name__
+        stages.append(entry)
+        return False
+
+
+def stage(name, detail=None):
+    return Stage(name, detail)
+
+
+def add_instrument_arguments(ap):
+    ap.add_argument("--report", default=None, help = "Write per-stage timings, throughput, I/O and memory to this JSON file")
+    ap.add_argument("--profile", action = "store_true", help = "Run under cProfile; stats go next to the report (or to profile.prof)")
+    ap.add_argument("--tracemalloc", action = "store_true", help = "Trace Python allocations and report their peak per stage")
+
+
+def summary():
+    lines = ["{0:<28}{1:>9}{2:>9}{3:>11}{4:>11}{5:>10}".format("stage", "wall s", "items", "items/s", "MB r/w", "peak MB")]
+    for entry in sorted(stages, key=lambda e: e['start_s']):
+        mb = "-" if entry['bytes_read'] is None else "{0:.0f}/{1:.0f}".format(entry['bytes_read'] / 1048576.0, entry['bytes_written'] / 1048576.0)
+        lines.append("{0:<28}{1:>9.3f}{2:>9}{3:>11}{4:>11}{5:>10}".format(
+            ("  " * entry['depth'] + entry['stage'])[:27], entry['wall_s'], entry['items'],
+            entry['items_per_s'] if entry['items_per_s'] is not None else "-", mb, entry['peak_rss_mb']))
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def session(namespace):
+    """
+        Definition: Instruments a whole command according to --report/--profile/--tracemalloc.
+    """
+    report = getattr(namespace, 'report', None)
+    profiler = None
+    tracemalloc = None
+    if getattr(namespace, 'tracemalloc', False):
+        import tracemalloc
+        tracemalloc.start()
+    if getattr(namespace, 'profile', False):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    del stages[:]
+    _started[0] = time.time()
+    try:
+        with stage('total', " ".join(sys.argv)):
+            yield
+    finally:
+        result = {'command': sys.argv, 'stages': sorted(stages, key=lambda e: e['start_s'])}
+        if profiler is not None:
+            profiler.disable()
+            import pstats
+            result['profile'] = (os.path.splitext(report)[0] if report else 'profile') + '.prof'
+            profiler.dump_stats(result['profile'])
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        if tracemalloc is not None:
+            snapshot = tracemalloc.take_snapshot()
+            result['tracemalloc_top'] = [str(stat) for stat in snapshot.statistics('lineno')[:10]]
+            tracemalloc.stop()
+        if report:
+            report_dir = os.path.dirname(report)
+            if report_dir and not os.path.exists(report_dir):
+                os.makedirs(report_dir)
+            with open(report, 'w') as f:
+                json.dump(result, f, indent=2)
+            print (summary())
+            print ("Report written to {0}".format(report))
@@ -0,0 +1,118 @@
+# Import necessary libraries
+import os, sys, json
+import shutil
+import tempfile
+from exporter import *
+from splitter import split_names
+from image_meta import read_size
+
+###########################################################
+##########         JSON to COCO Conversion       ##########
+###########################################################
+
+# This script is run from console terminal
+# Sample: python json_to_coco.py --dataset WIDER --workers 4
+# Writes datasets/COCO/annotations/instances_<split>.json and places the images
+# in datasets/COCO/<split>/. Records are streamed from the annotation store and
+# each split file is written as it goes: images straight to the file, annotations
+# to a temporary spool that is appended at the end, so memory does not depend
+# on the dataset size. Per-image work (image size, placement, serialisation)
+# runs on --workers processes.
+
+coco_dir = 'datasets/COCO/'
+coco_annotations = coco_dir + 'annotations/'
+# object keys with their own COCO field; the rest go to "attributes"
+coco_keys = ('class_name', 'bounding_box')
+
+
+class CocoWriter(object):
+    """
+        Definition: Streams one COCO instances file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.out = open(path + '.tmp', 'w')
+        self.spool = tempfile.TemporaryFile('w+')
+        self.images = 0
+        self.annotations = 0
+        self.out.write('{"info": {"description": "Dataprocess export"}, "licenses": [], "images": [')
+
+    def add(self, image, annotations):
+        self.out.write((',' if self.images else '') + '\n' + image)
+        self.images += 1
+        for annotation in annotations:
+            self.spool.write((',' if self.annotations else '') + '\n' + annotation)
+            self.annotations += 1
+
+    def close(self, categories):
+        self.out.write('\n], "annotations": [')
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, self.out)
+        self.spool.close()
+        self.out.write('\n], "categories": ' + json.dumps(categories) + '}\n')
+        self.out.close()
+        os.replace(self.path + '.tmp', self.path)
+
+
+class JsonToCoco(Exporter):
+
+    def coco(self, workers=1):
+        """
+            Definition: Exports the dataset as one COCO instances file per split.
+            Returns: number of exported images
+        """
+        print ("Convert json to coco")
+        jpgs = self.jpgs(workers)
+        writers = [CocoWriter(coco_annotations + 'instances_' + name + '.json') for name in split_names]
+        categories = {}
+        counts = {'images': 0, 'annotations': 0}
+        def tasks():
+            for record, src in self.records():
+                category_ids = [categories.setdefault(obj['class_name'], len(categories) + 1) for obj in record['objects']]
+                counts['images'] += 1
+                yield (self, record, jpgs.get(src, src), self.split(record['filename']),
+                       counts['images'], counts['annotations'] + 1, category_ids)
+                counts['annotations'] += len(record['objects'])
+        with stage('coco_export', self.json_dir) as s:
+            for split, image, annotations in run_batches(_coco_image, tasks(), workers):
+                writers[split].add(image, annotations)
+                s.items += 1
+        categories = [{'id': i, 'name': name, 'supercategory': 'none'}
+                      for name, i in sorted(categories.items(), key=lambda item: item[1])]
+        for writer in writers:
+            writer.close(categories)
+        print ("{0} images, {1} annotations".format(counts['images'], counts['annotations']))
+        return counts['images']
+
+    def image_entry(self, record, src, split, image_id, first_annotation_id, category_ids):
+        """
+            Definition: Places one image and serialises its COCO entries.
+            Returns: (split, image JSON, list of annotation JSON)
+        """
+        file_name = record['filename'].split(".")[0] + ".jpg"
+        place(src, coco_dir + split_names[split] + "/" + file_name, self.placement)
+        w, h, channels = read_size(src)
+        image = json.dumps({'id': image_id, 'file_name': file_name, 'width': w, 'height': h})
+        annotations = []
+        for k, (obj, category_id) in enumerate(zip(record['objects'], category_ids)):
+            x1, y1, x2, y2 = obj['bounding_box']
+            annotation = {'id': first_annotation_id + k, 'image_id': image_id, 'category_id': category_id,
+                          'bbox': [x1, y1, x2 - x1, y2 - y1], 'area': (x2 - x1) * (y2 - y1), 'iscrowd': 0}
+            attributes = dict((key, value) for key, value in obj.items() if key not in coco_keys)
+            if attributes:
+                annotation['attributes'] = attributes
+            annotations.append(json.dumps(annotation))
+        return split, image, annotations
+
+def _coco_image(args):
+    return args[0].image_entry(*args[1:])
+
+def main():
+    namespace = createParser("Export a converted dataset to COCO JSON").parse_args(sys.argv[1:])
+    with session(namespace):
+        coco = JsonToCoco(namespace.dataset, namespace.placement, namespace.quality, Splitter(seed=namespace.seed))
+        coco.make_directories([coco_annotations] + [coco_dir + name + "/" for name in split_names], namespace.force)
+        coco.coco(namespace.workers)
+
+if __name__ == '__main__':
+    main()
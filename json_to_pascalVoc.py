@@ -1,12 +1,19 @@
 # Import necessary libraries
 import os, sys, shutil, glob, argparse
-import numpy as np
-import json
-import argparse
-import random
+import multiprocessing
 from Parser import *
-from PIL import Image
-from lxml import etree
+from lazy import lazy_import
+from image_meta import SizeCache
+from ann_store import AnnotationStore
+from dataset import BoxDataset
+from manifest import Manifest, file_stamp, data_hash
+from placement import place, strategies, default_strategy
+from transcode import Transcoder, default_quality
+from voc_xml import voc_xml
+from splitter import Splitter, strata, split_names
+from registry import get_reader, dataset_names
+# only needed with --xml_writer lxml
+etree = lazy_import('lxml.etree')
 
 python_version = sys.version_info.major
 
@@ -19,34 +26,51 @@ python_version = sys.version_info.major
 # You can also specify dataset  from wich you copy images as:
 # INRIA,AFW,WIDER,IMDB_WIKI
 # Sample: python json_to_pascalVoc.py --dataset "INRIA"
+# Add --workers N to export images with N processes; splits are identical to a serial run.
+# Reruns only export new or changed images (--resume, default); --force starts over.
+# Images are reflinked or hard linked instead of copied when possible (--placement auto);
+# use --placement copy for independent files or symlink for links into the dataset folder.
+# INRIA .png images are transcoded once into datasets/transcoded/ (--quality, default 75)
+# or exported unchanged with --keep_format.
+# Splits come from a seeded hash of each file name (--seed), so images keep their split as
+# the dataset grows; --stratify reports the proportions reached per class, box count or
+# gender/age bucket. The lists are written to datasets/VOC/splits/;
+# --shard K/N exports every N-th image only, so N machines can share an export.
 
 TRAIN_COEF = 0.6
 VAL_COEF = 0.2
 TEST_COEF = 0.2
 
 json_path = ""
-inria_dataset = 'datasets/INRIA/images/'
 voc_train_ann = 'datasets/VOC/train/annotations/'
 voc_train_img = 'datasets/VOC/train/images/'
 voc_val_ann = 'datasets/VOC/val/annotations/'
 voc_val_img = 'datasets/VOC/val/images/'
 voc_test_ann = 'datasets/VOC/test/annotations/'
 voc_test_img = 'datasets/VOC/test/images/'
-image_count = 0
+voc_manifest = 'datasets/VOC/manifest.jsonl'
+voc_splits = 'datasets/VOC/splits/'
+split_dirs = [(voc_train_ann, voc_train_img), (voc_val_ann, voc_val_img), (voc_test_ann, voc_test_img)]
 parent_dir = {0: "train/", 1: "val/", 2: "test/" }
 child_dir = {0: '', 1: 'images/', 2: 'annotations/'}
 subdir = []
 
 class JsonToPascalVoc(Parser):
     
-    def __init__(self,dataset):
-        global image_count, json_path
-        json_path = 'datasets/JSON_'+str(dataset)+'/'
-        self.dataset_imgs_path = "datasets/"+str(dataset)+"/"
-        image_count = len(glob.glob(os.path.join('datasets/'+dataset+'/', "*.*")))
-        if str(dataset) == "WIDER" or str(dataset) == "INRIA":
-            self.dataset_imgs_path = "datasets/"+str(dataset)+"/images/"
-            image_count = len(glob.glob(os.path.join('datasets/'+dataset+'/images/', "*.*")))
+    def __init__(self,dataset,placement=default_strategy,quality=default_quality,keep_format=False,xml_writer="template",splitter=None):
+        global json_path
+        self.placement = placement
+        self.splitter = Splitter((TRAIN_COEF, VAL_COEF, TEST_COEF)) if splitter is None else splitter
+        # "template" streams the XML from precompiled templates, "lxml" builds an element tree
+        self.xml_writer = xml_writer
+        # INRIA .png images are transcoded to .jpg through the cache unless keep_format is set
+        self.transcoder = Transcoder(quality=quality)
+        self.keep_format = keep_format
+        reader = get_reader(str(dataset))
+        json_path = reader.json_dir
+        self.dataset_imgs_path = reader.images_dir
+        # extension of the dataset images; anything but .jpg is transcoded on export
+        self.source_ext = reader.image_ext
         
     def to_pasvoc_xml(self, fname, labels, coords, img_width, img_height, genders = None,ages = None):
         
@@ -112,31 +136,6 @@ class JsonToPascalVoc(Parser):
 
         return annotation
 
-    def parse_json_ann(self, filename):
-        """
-        Definition: Parses json annotation file to extract bounding box coordintates.
-
-        Returns: all_clases - contains a list of clases
-                     all_coords - contains a list of bdn_bxs
-        """
-        lfile = open(filename)
-        classes = []
-        bdn_bxs = []
-        genders = []
-        ages = []
-        f= open(filename)
-        for line in f:
-            line = line.replace("'", '"')
-            line = line.replace("nan", 'null')
-            my_dict = json.loads(line)
-            for obj in my_dict["objects"]:
-                classes.append(obj["class_name"])
-                bdn_bxs.append(obj["bounding_box"])
-                if "gender" in obj:
-                    genders.append(obj["gender"])
-                    ages.append(obj["age"])
-        return  classes,bdn_bxs,genders,ages
-    
     # make voc directories
     for i in range(len(parent_dir)):
         for j in range(len(child_dir)):
@@ -144,58 +143,193 @@ class JsonToPascalVoc(Parser):
             subdir.append("datasets/VOC/"+parent_dir[i])
             parent_dir[i] =  parent_dir[i].split("/")[0]+"/"
     # populate voc folders
-    def populate(self,et,f,dataset_imgs,fname,anns_dir,imgs_dir):
-        et.write(anns_dir + f.split(".json")[0] + ".xml", pretty_print=True)
-        if dataset_imgs == inria_dataset:
-            im = Image.open(fname)
-            im.save(imgs_dir + (f.split(".json")[0] + ".jpg"),"jpeg")
+    def populate(self,xml,f,dataset_imgs,fname,anns_dir,imgs_dir):
+        with open(anns_dir + f.split(".")[0] + ".xml", "wb") as out:
+            out.write(xml)
+        # INRIA images arrive here already transcoded (or as the original .png with keep_format)
+        place(fname, imgs_dir + f.split(".")[0] + self.image_ext(), self.placement)
+
+    def transcodes(self):
+        return self.source_ext != ".jpg" and not self.keep_format
+
+    def image_ext(self):
+        return self.source_ext if self.keep_format else ".jpg"
+
+    def image_path(self, f):
+        # INRIA images are kept as .png until they are exported
+        return self.dataset_imgs_path + f.split(".")[0] + self.source_ext
+
+    def jobs(self, sizes, dataset=None):
+        """
+        Definition: Lists dataset images that exist on disk, sorted by filename, and assigns
+        each one its split with the splitter, writing the split lists. Image sizes come
+        from the header-only size cache.
+        dataset is a BoxDataset straight from a reader; by default the annotation store is read.
+        Returns: list of (filename, (labels, coords, genders, ages), image path, width, height,
+                 annotations folder, images folder)
+        """
+        if dataset is None:
+            dataset = BoxDataset.from_records(AnnotationStore(json_path))
+        images = [i for i in sorted(range(len(dataset)), key=dataset.filenames.__getitem__)
+                  if os.path.isfile(self.image_path(dataset.filenames[i]))]
+        assignment = self.splitter.split(dataset, images)
+        self.splitter.write_lists(voc_splits, dataset.filenames, assignment)
+        if self.splitter.stratify != 'none':
+            for stratum, counts in self.splitter.balance(dataset, assignment):
+                print ("{0} {1}: {2}".format(self.splitter.stratify, stratum,
+                                             " ".join("{0} {1}".format(name, n) for name, n in zip(split_names, counts))))
+        jobs = []
+        for i in images:
+            f = dataset.filenames[i]
+            fname = self.image_path(f)
+            w, h, channels = sizes.get(fname)
+            jobs.append((f, dataset.image_annotations(i), fname, w, h) + split_dirs[assignment[i]])
+        return jobs
+
+    def outputs(self, f, fname, anns_dir, imgs_dir):
+        """
+        Definition: Files written by export for one image.
+        """
+        return [anns_dir + f.split(".")[0] + ".xml", imgs_dir + f.split(".")[0] + self.image_ext()]
+
+    def stamp(self, job):
+        """
+        Definition: Manifest stamp of a job: the source image stat and a hash of everything
+        that goes into its VOC annotation, including the split it was assigned.
+        """
+        f, annotations, fname, w, h, anns_dir, imgs_dir = job
+        stamp = file_stamp(fname)
+        stamp['annotation'] = data_hash([annotations, w, h, anns_dir, imgs_dir, self.image_ext(),
+                                         self.transcoder.quality if self.transcodes() else None])
+        return stamp
+
+    def export(self, f, annotations, fname, w, h, anns_dir, imgs_dir, json_dir=None):
+        """
+        Definition: Writes the VOC annotation and image for a single dataset image.
+        """
+        json_dir = json_path if json_dir is None else json_dir
+        labels, coords, genders, ages = annotations
+        xml_fname = json_dir + f.split(".")[0] + self.image_ext()
+        if self.xml_writer == "lxml":
+            xml = etree.tostring(self.to_pasvoc_xml(xml_fname, labels, coords, w, h, genders, ages), pretty_print=True)
         else:
-            shutil.copy(fname,imgs_dir)
-    def voc(self, label=None):
+            xml = voc_xml(xml_fname, labels, coords, w, h, genders, ages)
+        self.populate(xml, f, self.dataset_imgs_path, fname, anns_dir, imgs_dir)
+
+    def voc(self, label=None, workers=1, manifest=None, shard=(0, 1), dataset=None):
         print ("Convert json to voc")
-        ind = 0
         # Iterate through json annotations data
         #Copy all images from datasets to voc training, validation and test image folders.
-        for f in os.listdir(json_path):
-            
-            fname = json_path + f
-            if os.path.isfile(fname):
-               
-                if self.dataset_imgs_path ==  inria_dataset:
-                    fname = (self.dataset_imgs_path + f).split(".json")[0] + ".png"
-                    
-                else:
-                    fname = (self.dataset_imgs_path + f).split(".json")[0] + ".jpg"
-                
-                if os.path.isfile(fname):
-                    ind += 1
-                    img = Image.open(fname)
-                    w, h = img.size
-                    img.close()
-                    fname = (json_path + f).split(".json")[0] + ".jpg"
-                    labels, coords, genders, ages = self.parse_json_ann(os.path.join(json_path + f))
-                    annotation = self.to_pasvoc_xml(fname, labels, coords, w, h, genders, ages)
-                    et = etree.ElementTree(annotation)
-                    if self.dataset_imgs_path == inria_dataset:
-                        fname = (self.dataset_imgs_path + f).split(".json")[0] + ".png"
-                    else:
-                        fname = (self.dataset_imgs_path + f).split(".json")[0] + ".jpg"
-                    if ind <= image_count*TRAIN_COEF:
-                        self.populate(et,f,self.dataset_imgs_path,fname,voc_train_ann,voc_train_img)
-                    if image_count*TRAIN_COEF < ind <= image_count*(TRAIN_COEF+VAL_COEF):
-                        self.populate(et,f,self.dataset_imgs_path,fname,voc_val_ann,voc_val_img)
-                    
-                    if ind > image_count*(TRAIN_COEF+VAL_COEF):
-                        self.populate(et,f,self.dataset_imgs_path,fname,voc_test_ann,voc_test_img)
-                        
+        with stage('voc_jobs', json_path) as s:
+            sizes = SizeCache()
+            jobs = self.jobs(sizes, dataset)
+            sizes.save()
+            # images exported by an earlier (possibly interrupted) run are skipped
+            keys, stamps = [], []
+            pending = []
+            for i, job in enumerate(jobs):
+                keys.append(json_path + job[0])
+                stamps.append(self.stamp(job) if manifest != None else None)
+                if i % shard[1] != shard[0]:
+                    continue
+                if manifest == None or not manifest.is_current(keys[i], stamps[i]):
+                    pending.append(i)
+            s.items = len(jobs)
+        print ("{0} of {1} images to export".format(len(pending), len(jobs)))
+        if manifest != None:
+            self.remove_moved(manifest, [(keys[i], jobs[i]) for i in pending])
+        if self.transcodes():
+            # separate stage so encoding is spread over the pool and cached by source hash
+            with stage('transcode', json_path) as s:
+                transcoded = self.transcoder.run([jobs[i][2] for i in pending], workers)
+                s.items = len(transcoded)
+            for i in pending:
+                jobs[i] = jobs[i][:2] + (transcoded[jobs[i][2]],) + jobs[i][3:]
+        with stage('voc_export', json_path) as s:
+            if workers > 1:
+                pool = multiprocessing.Pool(workers)
+                try:
+                    # json_path is a module global, so pass it along for spawned workers
+                    for i in pool.imap_unordered(_export, [(i, self, json_path) + jobs[i] for i in pending], chunksize=64):
+                        self.done(manifest, keys[i], stamps[i], jobs[i])
+                        s.items += 1
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                for i in pending:
+                    self.export(*jobs[i])
+                    self.done(manifest, keys[i], stamps[i], jobs[i])
+                    s.items += 1
+
+    def remove_moved(self, manifest, jobs):
+        """
+        Definition: Deletes earlier outputs of images that now go to another split folder.
+        """
+        for key, job in jobs:
+            entry = manifest.entries.get(key)
+            if entry is None:
+                continue
+            f, annotations, fname, w, h, anns_dir, imgs_dir = job
+            current = self.outputs(f, fname, anns_dir, imgs_dir)
+            for output in entry['outputs']:
+                if output not in current and os.path.lexists(output):
+                    os.remove(output)
+
+    def done(self, manifest, key, stamp, job):
+        if manifest != None:
+            f, annotations, fname, w, h, anns_dir, imgs_dir = job
+            manifest.record(key, stamp, self.outputs(f, fname, anns_dir, imgs_dir))
+
+def _export(args):
+    i, voc, json_dir, f, annotations, fname, w, h, anns_dir, imgs_dir = args
+    voc.export(f, annotations, fname, w, h, anns_dir, imgs_dir, json_dir)
+    return i
+
+def add_voc_arguments(ap):
+    ap.add_argument("--workers", type=int, default=1, required = False, help = "Number of processes exporting images")
+    ap.add_argument("--quality", type=int, default=default_quality, required = False, help = "JPEG quality for transcoded INRIA images")
+    ap.add_argument("--keep_format", action="store_true", help = "Export INRIA images as the original .png, without decoding")
+    ap.add_argument("--xml_writer", default="template", choices=["template", "lxml"], required = False, help = "VOC XML writer; both write identical files")
+    ap.add_argument("--seed", type=int, default=0, required = False, help = "Seed of the hash based train/val/test split")
+    ap.add_argument("--stratify", default="none", choices=strata, required = False, help = "Report split proportions per class, box count bucket or gender/age bucket (the split itself stays per image)")
+    ap.add_argument("--shard", default="0/1", required = False, help = "K/N: export only images K, K+N, K+2N, ... of the sorted list")
+
+def parse_shard(ap, namespace):
+    try:
+        shard = tuple(int(n) for n in namespace.shard.split("/"))
+    except ValueError:
+        shard = ()
+    if len(shard) != 2 or not 0 <= shard[0] < shard[1]:
+        ap.error("--shard must be K/N with integers 0 <= K < N")
+    return shard
+
+def convert(namespace, shard, dataset=None):
+    """
+    Definition: Exports namespace.dataset to the VOC folders, from the annotation store
+    or from a BoxDataset handed over by a reader.
+    """
+    splitter = Splitter((TRAIN_COEF, VAL_COEF, TEST_COEF), namespace.seed, namespace.stratify)
+    voc = JsonToPascalVoc(namespace.dataset, namespace.placement, namespace.quality, namespace.keep_format, namespace.xml_writer, splitter)
+    voc.make_directories(subdir, namespace.force)
+    manifest = Manifest(voc_manifest)
+    if namespace.force:
+        manifest.clear()
+    try:
+        voc.voc(workers=namespace.workers, manifest=manifest, shard=shard, dataset=dataset)
+    finally:
+        manifest.close()
+
 def main():
     
     ap = argparse.ArgumentParser()
-    ap.add_argument("--dataset", default="INRIA", required = True, help = "Type dataset to receive images from")
+    ap.add_argument("--dataset", default="INRIA", required = True, choices=dataset_names(), help = "Type dataset to receive images from")
+    ap.add_argument("--placement", default=default_strategy, choices=strategies, required = False, help = "How images are placed: reflink, hardlink, symlink, copy or auto")
+    add_voc_arguments(ap)
+    Parser.add_resume_arguments(ap)
+    add_instrument_arguments(ap)
     namespace = ap.parse_args(sys.argv[1:])
-    
-    voc = JsonToPascalVoc(namespace.dataset)
-    voc.make_directories(subdir)
-    voc.voc()
+    with session(namespace):
+        convert(namespace, parse_shard(ap, namespace))
 if __name__ == '__main__':
     main() 
\ No newline at end of file
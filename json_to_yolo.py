@@ -0,0 +1,97 @@
+# Import necessary libraries
+import os, sys
+import numpy as np
+from exporter import *
+from splitter import split_names
+from dataset import BoxDataset
+from image_meta import SizeCache
+
+###########################################################
+##########         JSON to YOLO Conversion       ##########
+###########################################################
+
+# This script is run from console terminal
+# Sample: python json_to_yolo.py --dataset AFW --workers 4
+# Writes datasets/YOLO/images/<split>/<name>.jpg, one label file per image in
+# datasets/YOLO/labels/<split>/<name>.txt ("class cx cy w h", normalised to the
+# image size) and datasets/YOLO/data.yaml with the split folders and class names.
+# Boxes are clipped and normalised for the whole dataset at once with array
+# operations; label files and images are written by --workers processes.
+
+yolo_dir = 'datasets/YOLO/'
+
+
+class JsonToYolo(Exporter):
+
+    def normalised(self, dataset, widths, heights):
+        """
+            Definition: Clips all boxes to their image and converts them to normalised
+                        cx, cy, w, h in one pass over the box array.
+            Returns: float64 (N, 4) array
+        """
+        dataset = dataset.clip(widths, heights)
+        scale = np.stack([widths, heights, widths, heights], axis=1).astype(np.float64)[dataset.image_index]
+        return dataset.boxes_as('cxcywh') / scale
+
+    def yolo(self, workers=1):
+        """
+            Definition: Exports the dataset in the YOLO layout.
+            Returns: number of exported images
+        """
+        print ("Convert json to yolo")
+        jpgs = self.jpgs(workers)
+        sources = []
+        def records():
+            for record, src in self.records():
+                sources.append(jpgs.get(src, src))
+                yield record
+        with stage('yolo_normalise', self.json_dir) as s:
+            dataset = BoxDataset.from_records(records())
+            sizes = SizeCache()
+            try:
+                shapes = np.array([sizes.get(src)[:2] for src in sources], dtype=np.int64).reshape(-1, 2)
+            finally:
+                sizes.save()
+            boxes = self.normalised(dataset, shapes[:, 0], shapes[:, 1])
+            s.items = len(boxes)
+        tasks = ((self, dataset.filenames[i], sources[i], self.split(dataset.filenames[i]),
+                  dataset.class_id[dataset.image_slice(i)], boxes[dataset.image_slice(i)])
+                 for i in range(len(dataset)))
+        with stage('yolo_export', self.json_dir) as s:
+            count = s.items = sum(run_batches(_yolo_image, tasks, workers))
+        self.write_data_yaml(dataset.class_names)
+        print ("{0} images, {1} boxes".format(count, len(boxes)))
+        return count
+
+    def image_labels(self, filename, src, split, class_id, boxes):
+        """
+            Definition: Writes the label file and places the image of one dataset image.
+        """
+        stem = filename.split(".")[0]
+        with open(yolo_dir + "labels/" + split_names[split] + "/" + stem + ".txt", "w") as out:
+            for c, (cx, cy, w, h) in zip(class_id.tolist(), boxes.tolist()):
+                out.write("%d %.6f %.6f %.6f %.6f\n" % (c, cx, cy, w, h))
+        place(src, yolo_dir + "images/" + split_names[split] + "/" + stem + ".jpg", self.placement)
+        return 1
+
+    def write_data_yaml(self, class_names):
+        with open(yolo_dir + "data.yaml", "w") as out:
+            out.write("path: {0}\n".format(os.path.abspath(yolo_dir)))
+            for name in split_names:
+                out.write("{0}: images/{0}\n".format(name))
+            out.write("nc: {0}\n".format(len(class_names)))
+            out.write("names: [{0}]\n".format(", ".join("'{0}'".format(name) for name in class_names)))
+
+def _yolo_image(args):
+    return args[0].image_labels(*args[1:])
+
+def main():
+    namespace = createParser("Export a converted dataset to YOLO labels").parse_args(sys.argv[1:])
+    with session(namespace):
+        yolo = JsonToYolo(namespace.dataset, namespace.placement, namespace.quality, Splitter(seed=namespace.seed))
+        yolo.make_directories([yolo_dir + kind + "/" + name + "/" for kind in ("images", "labels") for name in split_names],
+                              namespace.force)
+        yolo.yolo(namespace.workers)
+
+if __name__ == '__main__':
+    main()
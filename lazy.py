@@ -0,0 +1,32 @@
+# Import necessary libraries
+import importlib
+
+###########################################################
+##########            Deferred imports           ##########
+###########################################################
+
+# Heavy optional dependencies (cv2, matplotlib, lxml, h5py, scipy) cost
+# hundreds of milliseconds to import. A LazyModule stands in for the module
+# and imports it on first attribute access, so scripts that never touch it,
+# or only print --help, do not pay for it.
+# Sample:
+#   cv2 = lazy_import('cv2')
+#   image = cv2.imread(filename)   # cv2 is imported here
+
+class LazyModule(object):
+    """
+        Definition: Module proxy importing the real module on first use.
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return getattr(module, attr)
+
+def lazy_import(name):
+    return LazyModule(name)
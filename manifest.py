@@ -0,0 +1,119 @@
+# Import necessary libraries
+import os, json
+import hashlib
+
+###########################################################
+##########    Conversion manifest for resuming   ##########
+###########################################################
+
+# Records, for every source item (archive member, annotation file, exported
+# image), a stamp of the source (size/mtime and/or content hash) and the
+# outputs produced from it. Reruns skip items whose stamp is unchanged and
+# whose outputs still exist. Entries are appended to a JSON Lines log as
+# soon as an item is done, so an interrupted run resumes where it stopped.
+# Converters keep placed images in the manifest of the dataset root and the
+# annotation source in the one of its JSON folder, so parsing never loads
+# per-image entries.
+# Sample:
+#   manifest = Manifest('datasets/JSON_AFW/')
+#   if not manifest.is_current(key, stamp):
+#       ...produce outputs...
+#       manifest.record(key, stamp, outputs)
+#   manifest.close()
+
+manifest_name = 'manifest.jsonl'
+
+
+def file_hash(filename, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def data_hash(data):
+    if not isinstance(data, bytes):
+        data = json.dumps(data, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_stamp(filename, with_hash=False):
+    """
+        Definition: Size and mtime of a file, plus its sha1 when with_hash is set.
+    """
+    st = os.stat(filename)
+    stamp = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if with_hash:
+        stamp['sha1'] = file_hash(filename)
+    return stamp
+
+
+class Manifest(object):
+    """
+        Definition: Append-only log of source stamps and the outputs made from them.
+    """
+    def __init__(self, path):
+        if os.path.isdir(path) or path.endswith('/'):
+            path = os.path.join(path, manifest_name)
+        self.path = path
+        self.entries = {}
+        self.lines = 0
+        self._log = None
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line of an interrupted run can be cut short
+                        continue
+                    self.entries[entry['key']] = entry
+                    self.lines += 1
+
+    def is_current(self, key, stamp):
+        """
+            Definition: True when key was produced from an identical source and all of
+            its outputs still exist. When both stamps carry a content hash the mtime is
+            ignored, so a touched but unchanged file stays current.
+        """
+        entry = self.entries.get(key)
+        if entry is None or not all(os.path.exists(output) for output in entry['outputs']):
+            return False
+        old = entry['stamp']
+        ignore = ('mtime_ns',) if 'sha1' in old and 'sha1' in stamp else ()
+        return all(old.get(name) == value for name, value in stamp.items() if name not in ignore)
+
+    def record(self, key, stamp, outputs):
+        entry = {'key': key, 'stamp': stamp, 'outputs': list(outputs)}
+        self.entries[key] = entry
+        if self._log is None:
+            manifest_dir = os.path.dirname(self.path)
+            if manifest_dir and not os.path.exists(manifest_dir):
+                os.makedirs(manifest_dir)
+            self._log = open(self.path, 'a')
+        self._log.write(json.dumps(entry) + '\n')
+        self._log.flush()
+        self.lines += 1
+
+    def clear(self):
+        self.close()
+        self.entries = {}
+        self.lines = 0
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        """
+            Definition: Closes the log, compacting it when superseded entries dominate.
+        """
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if self.lines > 2 * len(self.entries) and os.path.isfile(self.path):
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + '\n')
+            os.replace(tmp, self.path)
+            self.lines = len(self.entries)
@@ -0,0 +1,144 @@
+# Import necessary libraries
+import os
+from Parser import *
+from registry import modules
+from image_hash import HashCache, near_duplicates
+from transcode import Transcoder
+
+###########################################################
+##########     Merge of converted datasets       ##########
+###########################################################
+
+# Combines the annotation stores of converted datasets into one corpus:
+#  - images are renamed <dataset>_<original name>, so ids never collide across
+#    datasets or runs, and placed (linked when possible) into datasets/MERGED/;
+#    images that are not .jpg (INRIA) go through the transcode cache
+#  - class names are mapped onto one class map (face, person by default)
+#  - duplicate images are dropped, keeping the one from the earliest dataset
+#    given, by content hash or perceptual hash (cached, computed in parallel)
+# The result is registered as the MERGED dataset, so it exports like any other.
+# Sample: python merge.py --datasets WIDER AFW INRIA IMDB-WIKI --dedup perceptual --max_distance 4
+# Sample: python json_to_pascalVoc.py --dataset MERGED
+
+merged_destination = 'datasets/MERGED/'
+json_dir = 'datasets/JSON_MERGED/'
+directories = [merged_destination, json_dir]
+# source class name -> merged class name; names not listed are kept as they are
+default_class_map = {'face': 'face', 'Person': 'person'}
+dedup_modes = ('none', 'content', 'perceptual')
+
+@register('MERGED')
+class MergedDataset(Parser):
+
+    root = merged_destination
+    images_dir = merged_destination
+    json_dir = json_dir
+    directories = directories
+    # merges converted datasets, so no archive options (--stream, --extract_workers, ...)
+    subfolders = None
+
+    def __init__(self, datasets=(), class_map=None, dedup='content', max_distance=0, workers=1):
+        self.datasets = list(datasets)
+        self.class_map = dict(default_class_map if class_map is None else class_map)
+        self.dedup = dedup
+        self.max_distance = max_distance
+        self.workers = workers
+
+    @staticmethod
+    def add_arguments(ap):
+        ap.add_argument("--datasets", nargs="+", default=[n for n in sorted(modules) if n != 'MERGED'],
+                        help = "Converted datasets to merge, in order of preference for duplicates")
+        ap.add_argument("--class_map", nargs="*", default=[], metavar="SOURCE=TARGET",
+                        help = "Class renames on top of face=face Person=person")
+        ap.add_argument("--dedup", default="content", choices=dedup_modes, help = "Duplicate detection")
+        ap.add_argument("--max_distance", type=int, default=0, help = "Perceptual hash bits two duplicates may differ in")
+        ap.add_argument("--hash_workers", type=int, default=1, help = "Processes hashing images")
+
+    @classmethod
+    def from_namespace(cls, namespace):
+        class_map = dict(default_class_map)
+        class_map.update(item.split("=", 1) for item in namespace.class_map)
+        return cls(namespace.datasets, class_map, namespace.dedup, namespace.max_distance, namespace.hash_workers)
+
+    def merged_name(self, dataset, filename):
+        return "{0}_{1}".format(dataset.lower(), filename)
+
+    def sources(self):
+        """
+            Definition: Records of all datasets, renamed and class mapped, with their images.
+            Returns: list of (merged record, source image path)
+        """
+        items = []
+        for name in self.datasets:
+            reader = get_reader(name)
+            if not AnnotationStore.exists(reader.json_dir):
+                print ("Skipping {0}: convert it first ({1} not found)".format(name, reader.json_dir))
+                continue
+            for record in AnnotationStore(reader.json_dir):
+                src = reader.images_dir + record['filename'].split(".")[0] + reader.image_ext
+                if not os.path.isfile(src):
+                    continue
+                for obj in record['objects']:
+                    obj['class_name'] = self.class_map.get(obj['class_name'], obj['class_name'])
+                record['filename'] = self.merged_name(name, record['filename'].split(".")[0] + ".jpg")
+                items.append((record, src))
+        return items
+
+    def duplicates(self, items):
+        """
+            Returns: set of positions in items whose image duplicates an earlier one
+        """
+        if self.dedup == 'none':
+            return set()
+        cache = HashCache()
+        try:
+            with stage('hash', self.dedup) as s:
+                hashes = cache.get([src for record, src in items], self.dedup, self.workers)
+                s.items = len(hashes)
+        finally:
+            cache.save()
+        # first of each group wins, so datasets listed first are kept
+        if self.dedup == 'perceptual':
+            first = near_duplicates(dict((i, hashes[src]) for i, (record, src) in enumerate(items)), self.max_distance)
+        else:
+            first = near_duplicates(dict((i, hashes[src]) for i, (record, src) in enumerate(items)))
+        return set(i for i in first if first[i] != i)
+
+    def fetch(self, namespace, manifest):
+        """
+            Definition: Places the images of the kept records in the merged folder and
+                        drops images left there by earlier merges.
+            Returns: ("merge", stamp of the sources and settings, callable returning the record generator)
+        """
+        with stage('merge_sources', " ".join(self.datasets)) as s:
+            items = self.sources()
+            s.items = len(items)
+        dropped = self.duplicates(items)
+        print ("Merged {0} images, dropped {1} duplicates".format(len(items) - len(dropped), len(dropped)))
+        kept = [item for i, item in enumerate(items) if i not in dropped]
+        jpgs = Transcoder().run([src for record, src in kept if not src.endswith(".jpg")], self.workers)
+        names = set()
+        with stage('merge_place', merged_destination) as s:
+            for record, src in kept:
+                src = jpgs.get(src, src)
+                target = merged_destination + record['filename']
+                names.add(record['filename'])
+                stamp = file_stamp(src)
+                if not manifest.is_current(target, stamp):
+                    place(src, target, namespace.placement)
+                    manifest.record(target, stamp, [target])
+                    s.items += 1
+        for f in os.listdir(merged_destination):
+            if f.endswith(".jpg") and f not in names:
+                os.remove(merged_destination + f)
+        stores = [file_stamp(AnnotationStore(get_reader(name).json_dir).path) for name in self.datasets
+                  if AnnotationStore.exists(get_reader(name).json_dir)]
+        stamp = {'sha1': data_hash([stores, self.datasets, sorted(self.class_map.items()), self.dedup,
+                                    self.max_distance, sorted(names)])}
+        return "merge", stamp, lambda: (record for record, src in kept)
+
+def main():
+    MergedDataset.to_json()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Import necessary libraries
+import sys, argparse
+from Parser import *
+from dataset import BoxDataset
+from registry import get_reader, dataset_names
+from json_to_pascalVoc import add_voc_arguments, parse_shard, convert
+
+###########################################################
+##########     Archive to Pascal VOC pipeline    ##########
+###########################################################
+
+# Runs archive -> records -> VOC for one dataset in a single process. The
+# reader registered for the dataset puts the images in place and parses the
+# annotations into a BoxDataset that goes straight to the VOC exporter,
+# without writing the JSON annotation store.
+# Takes the options of the dataset converter and of json_to_pascalVoc.py.
+# Sample: python pipeline.py --dataset AFW --stream --workers 4
+# Sample: python pipeline.py --dataset IMDB-WIKI --db imdb --min_face_score 3 --stratify gender_age
+
+def createParser(argv):
+    # the dataset decides which source options exist, so it is looked at first
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--dataset")
+    known, rest = pre.parse_known_args(argv)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dataset", required = True, choices=dataset_names(), help = "Dataset to convert")
+    reader = None
+    if known.dataset in dataset_names():
+        reader = get_reader(known.dataset)
+        reader.add_reader_arguments(ap)
+    ap.add_argument("--placement", default=default_strategy, choices=strategies, required = False, help = "How images are placed: reflink, hardlink, symlink, copy or auto")
+    add_voc_arguments(ap)
+    Parser.add_resume_arguments(ap)
+    add_instrument_arguments(ap)
+    namespace = ap.parse_args(argv)
+    return reader, namespace, parse_shard(ap, namespace)
+
+def main():
+    reader_class, namespace, shard = createParser(sys.argv[1:])
+    with session(namespace):
+        reader = reader_class.from_namespace(namespace)
+        reader.make_directories([d for d in reader_class.directories if d != reader_class.json_dir], namespace.force)
+        # images already in place are skipped on reruns, as with the separate converters
+        manifest = Manifest(reader_class.root)
+        try:
+            key, stamp, make_records = reader.fetch(namespace, manifest)
+        finally:
+            manifest.close()
+        # its per-image entries are not kept while the records are parsed
+        manifest = None
+        with stage('parse', key) as s:
+            # the VOC splits need the whole dataset, kept here in its columnar form
+            dataset = BoxDataset.from_records(make_records())
+            s.items = len(dataset)
+        convert(namespace, shard, dataset)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Import necessary libraries
+import os, sys
+import errno
+import shutil
+
+###########################################################
+##########        Image placement strategies     ##########
+###########################################################
+
+# Puts an image at its destination without copying bytes when the
+# filesystem allows it:
+#   reflink  - copy-on-write clone (btrfs, xfs, ...), independent file
+#   hardlink - second name for the same inode (same filesystem only)
+#   symlink  - relative symbolic link to the source
+#   copy     - plain byte copy
+#   auto     - reflink, then hardlink, then copy
+# Sample: place('datasets/AFW/afw_0001.jpg', 'datasets/VOC/train/images/', 'auto')
+
+strategies = ('auto', 'reflink', 'hardlink', 'symlink', 'copy')
+default_strategy = 'auto'
+
+# Linux FICLONE ioctl
+FICLONE = 0x40049409
+# errors meaning "this filesystem/pair of paths cannot do it", not real failures
+UNSUPPORTED = set([errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY, errno.ENOSYS,
+                   getattr(errno, 'EOPNOTSUPP', errno.EINVAL), getattr(errno, 'ENOTSUP', errno.EINVAL)])
+
+# strategies that already failed as unsupported in this process, per (src device, dst device)
+_unsupported = set()
+
+
+def reflink(src, dst):
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOTSUP, "reflink is only supported on Linux", dst)
+    import fcntl
+    with open(src, 'rb') as s:
+        with open(dst, 'wb') as d:
+            try:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            except (IOError, OSError):
+                d.close()
+                os.remove(dst)
+                raise
+
+
+def symlink(src, dst):
+    os.symlink(os.path.relpath(os.path.abspath(src), os.path.dirname(os.path.abspath(dst))), dst)
+
+
+def copy(src, dst):
+    shutil.copy(src, dst)
+
+
+_place = {'reflink': reflink, 'hardlink': os.link, 'symlink': symlink, 'copy': copy}
+
+
+def place(src, dst, strategy=default_strategy):
+    """
+        Definition: Places src at dst (a file path, or a directory to keep the basename)
+                    with the given strategy, falling back to a byte copy when links are
+                    not supported between the two paths.
+        Returns: destination path
+    """
+    if strategy not in strategies:
+        raise ValueError("Unknown placement strategy: {0}".format(strategy))
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.lexists(dst):
+        os.remove(dst)
+    order = ('reflink', 'hardlink', 'copy') if strategy == 'auto' else (strategy, 'copy')
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dst))).st_dev)
+    for name in order:
+        if (name, devices) in _unsupported:
+            continue
+        try:
+            _place[name](src, dst)
+            return dst
+        except (IOError, OSError) as e:
+            if name == 'copy' or e.errno not in UNSUPPORTED:
+                raise
+            _unsupported.add((name, devices))
+    return dst
@@ -0,0 +1,60 @@
+# Import necessary libraries
+import importlib
+
+###########################################################
+##########          Dataset reader registry      ##########
+###########################################################
+
+# Converters register their reader class under the dataset name used on the
+# command line. The built-in datasets are imported only when asked for, so
+# looking one up does not load the dependencies of the others.
+# A reader class provides:
+#   root, images_dir, image_ext, json_dir, directories - where files go
+#   subfolders           - (images, annotations, images & annotations) archive defaults,
+#                          None when the reader does not convert an archive
+#   add_arguments(ap)    - dataset specific command line options
+#   from_namespace(ns)   - reader configured from parsed options
+#   fetch(ns, manifest)  - puts the images in images_dir and returns
+#                          (source key, source stamp, callable returning a generator
+#                          of image records, parsed lazily)
+# Sample:
+#   @register('AFW')
+#   class AfwToJson(Parser): ...
+#   reader = get_reader('AFW').from_namespace(namespace)
+
+readers = {}
+# built-in dataset -> module registering it
+modules = {'AFW': 'afw_to_json',
+           'IMDB-WIKI': 'imdb_wiki_to_json',
+           'INRIA': 'inria_to_json',
+           'MERGED': 'merge',
+           'WIDER': 'wider_to_json'}
+
+
+def register(name):
+    """
+        Definition: Class decorator adding a reader to the registry under name.
+                    The reader must define fetch (see above); TypeError otherwise.
+    """
+    def decorate(cls):
+        if not callable(getattr(cls, 'fetch', None)):
+            raise TypeError("Reader {0} for {1} does not define fetch(namespace, manifest)".format(cls.__name__, name))
+        cls.name = name
+        readers[name] = cls
+        return cls
+    return decorate
+
+
+def get_reader(name):
+    """
+        Returns: reader class registered under name, importing its module if needed
+    """
+    if name not in readers and name in modules:
+        importlib.import_module(modules[name])
+    if name not in readers:
+        raise ValueError("Unknown dataset: {0} (known: {1})".format(name, ", ".join(dataset_names())))
+    return readers[name]
+
+
+def dataset_names():
+    return sorted(set(readers) | set(modules))
@@ -0,0 +1,125 @@
+# Import necessary libraries
+import os
+import struct
+import hashlib
+import numpy as np
+
+###########################################################
+##########     Seeded train/val/test splitter    ##########
+###########################################################
+
+# Assigns every image to a split from a seeded hash of its file name, so the
+# assignment does not depend on directory order, on the number of images or
+# on the machine, and images never change split as the dataset grows. The hash
+# fraction of an image is uniform within any stratum, so it stands in for the
+# image's rank quantile there: every stratum (dominant class, box count bucket
+# or gender/age bucket) gets the fractions in expectation without counting it.
+# With stratify, balance() reports how close each stratum came.
+# Sample:
+#   splitter = Splitter((0.6, 0.2, 0.2), seed=0, stratify='boxes')
+#   assignment = splitter.split(dataset)   # {image index: 0 train, 1 val, 2 test}
+#   splitter.write_lists('datasets/VOC/splits/', dataset.filenames, assignment)
+#   for stratum, counts in splitter.balance(dataset, assignment): ...
+
+split_names = ('train', 'val', 'test')
+strata = ('none', 'class', 'boxes', 'gender_age')
+# upper bounds of the box count and age buckets
+box_buckets = (0, 1, 2, 5, 10)
+age_buckets = (17, 29, 44, 59)
+
+
+def hash_fraction(key, seed=0):
+    """
+        Definition: Maps key to a float in [0, 1), stable across runs for a given seed.
+    """
+    digest = hashlib.sha1("{0}:{1}".format(seed, key).encode('utf-8')).digest()
+    return struct.unpack('>Q', digest[:8])[0] / float(1 << 64)
+
+
+def bucket(value, bounds):
+    return int(np.searchsorted(bounds, value, side='left'))
+
+
+class Splitter(object):
+    """
+        Definition: Hash based, optionally stratified, split assignment.
+    """
+    def __init__(self, fractions=(0.6, 0.2, 0.2), seed=0, stratify='none'):
+        if stratify not in strata:
+            raise ValueError("Unknown stratification: {0}".format(stratify))
+        self.bounds = np.cumsum(fractions) / float(sum(fractions))
+        self.seed = seed
+        self.stratify = stratify
+
+    def pick(self, fraction):
+        return min(int(np.searchsorted(self.bounds, fraction, side='right')), len(self.bounds) - 1)
+
+    def assign(self, filename):
+        """
+            Definition: Split of a single image, from its file name only.
+        """
+        return self.pick(hash_fraction(filename, self.seed))
+
+    def stratum(self, dataset, i):
+        """
+            Definition: Stratum of image i of a BoxDataset.
+        """
+        s = dataset.image_slice(i)
+        if self.stratify == 'class':
+            class_id = dataset.class_id[s]
+            if len(class_id) == 0:
+                return None
+            # most frequent class, lowest id on ties
+            return int(np.bincount(class_id).argmax())
+        if self.stratify == 'boxes':
+            return bucket(s.stop - s.start, box_buckets)
+        if self.stratify == 'gender_age':
+            ages = dataset.age[s]
+            known = ~np.isnan(ages)
+            if not known.any():
+                return None
+            first = np.flatnonzero(known)[0]
+            gender = dataset.gender[s][first]
+            return (None if np.isnan(gender) else bool(gender > 0.5), bucket(ages[first], age_buckets))
+        return None
+
+    def split(self, dataset, images=None):
+        """
+            Definition: Assigns the given images (all by default) of a BoxDataset, each
+                        from its own file name, so no count of the dataset or of a stratum
+                        is involved.
+            Returns: dict of image index -> split number
+        """
+        images = range(len(dataset)) if images is None else images
+        return dict((i, self.assign(dataset.filenames[i])) for i in images)
+
+    def balance(self, dataset, assignment):
+        """
+            Definition: Images per split in each stratum of the assignment.
+            Returns: list of (stratum, list of counts per split), sorted by stratum
+        """
+        counts = {}
+        for i, split in assignment.items():
+            counts.setdefault(self.stratum(dataset, i), [0] * len(self.bounds))[split] += 1
+        return sorted(counts.items(), key=lambda item: str(item[0]))
+
+    def write_lists(self, folder, filenames, assignment):
+        """
+            Definition: Writes <split>.txt files listing the image stems of each split,
+                        sorted, in the VOC ImageSets style.
+            Returns: list of written files
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        lists = [[] for name in split_names]
+        for i, split in assignment.items():
+            lists[split].append(os.path.splitext(filenames[i])[0])
+        written = []
+        for name, stems in zip(split_names, lists):
+            path = os.path.join(folder, name + '.txt')
+            tmp = path + '.tmp'
+            with open(tmp, 'w') as f:
+                f.writelines(stem + '\n' for stem in sorted(stems))
+            os.replace(tmp, path)
+            written.append(path)
+        return written
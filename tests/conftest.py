@@ -0,0 +1,8 @@
+# Import necessary libraries
+import os, sys
+
+# the modules are flat files at the top of the repository; the archive helpers
+# of the benchmarks build the test archives
+root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
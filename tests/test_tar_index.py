@@ -0,0 +1,124 @@
+# Import necessary libraries
+import os
+import tarfile
+import pytest
+
+from synthetic import add_tar
+from archive_index import TarIndex
+
+###########################################################
+##########     TarIndex against tarfile          ##########
+###########################################################
+
+# Every case extracts the same archive with TarIndex and with tarfile.extractall
+# and compares the trees: regular files (data, mode, mtime), symbolic links
+# (where they point) and hard links (data; TarIndex writes a copy).
+# Sample: python -m pytest tests/test_tar_index.py
+
+
+def add_link(archive, name, linkname, kind):
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    info.linkname = linkname
+    archive.addfile(info)
+
+
+def make_tar(path, files=(), symlinks=(), hardlinks=()):
+    with tarfile.open(path, 'w') as archive:
+        for name, data in files:
+            add_tar(archive, name, data)
+        for name, linkname in symlinks:
+            add_link(archive, name, linkname, tarfile.SYMTYPE)
+        for name, linkname in hardlinks:
+            add_link(archive, name, linkname, tarfile.LNKTYPE)
+    return path
+
+
+def reference(archive, out, keep=lambda member: True):
+    with tarfile.open(archive) as tar:
+        tar.extractall(out, [member for member in tar.getmembers() if keep(member)])
+
+
+def tree(folder):
+    """
+        Returns: dict of relative path -> ('link', target) or ('file', data, mode, mtime)
+    """
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(folder):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            relative = os.path.relpath(path, folder)
+            if os.path.islink(path):
+                entries[relative] = ('link', os.readlink(path))
+            elif os.path.isfile(path):
+                st = os.stat(path)
+                with open(path, 'rb') as f:
+                    entries[relative] = ('file', f.read(), st.st_mode & 0o777, int(st.st_mtime))
+    return entries
+
+
+def files(count, prefix='data/'):
+    return [('{0}{1}/{2:04d}.jpg'.format(prefix, i % 3, i), os.urandom(100 + i)) for i in range(count)]
+
+
+def test_regular_files_match_tarfile(tmp_path):
+    archive = make_tar(str(tmp_path / 'a.tar'), files(20))
+    reference(archive, str(tmp_path / 'ref'))
+    count = TarIndex(archive, index_dir=str(tmp_path / 'index')).extract([('', str(tmp_path / 'out'))])
+    assert count == 20
+    assert tree(str(tmp_path / 'out')) == tree(str(tmp_path / 'ref'))
+
+
+def test_links_match_tarfile(tmp_path):
+    archive = make_tar(str(tmp_path / 'a.tar'), files(4),
+                       symlinks=[('data/latest.jpg', '0/0000.jpg'), ('data/away', '../../elsewhere')],
+                       hardlinks=[('data/1/copy.jpg', 'data/1/0001.jpg')])
+    reference(archive, str(tmp_path / 'ref'))
+    TarIndex(archive, index_dir=str(tmp_path / 'index')).extract([('', str(tmp_path / 'out'))])
+    out, ref = tree(str(tmp_path / 'out')), tree(str(tmp_path / 'ref'))
+    assert out == ref
+    assert out['data/latest.jpg'] == ('link', '0/0000.jpg')
+    assert out['data/1/copy.jpg'][1] == out['data/1/0001.jpg'][1]
+
+
+def test_subfolder_is_stripped(tmp_path):
+    archive = make_tar(str(tmp_path / 'a.tar'), files(6, 'top/data/'),
+                       symlinks=[('top/data/latest.jpg', '0/0000.jpg')],
+                       hardlinks=[('top/data/1/copy.jpg', 'top/data/1/0001.jpg')])
+    reference(archive, str(tmp_path / 'ref'))
+    TarIndex(archive, index_dir=str(tmp_path / 'index')).extract([('top/data/', str(tmp_path / 'out'))])
+    assert tree(str(tmp_path / 'out')) == tree(str(tmp_path / 'ref' / 'top' / 'data'))
+
+
+def test_members_outside_the_target_are_left_out(tmp_path):
+    archive = make_tar(str(tmp_path / 'a.tar'), files(3) + [('data/../../escaped.jpg', b'x'), ('/abs.jpg', b'y')],
+                       symlinks=[('data/../../escaped_link', 'anywhere')])
+    outside = lambda member: '..' not in member.name.split('/') and not member.name.startswith('/')
+    reference(archive, str(tmp_path / 'ref'), outside)
+    TarIndex(archive, index_dir=str(tmp_path / 'index')).extract([('data/', str(tmp_path / 'box' / 'out'))])
+    assert tree(str(tmp_path / 'box' / 'out')) == tree(str(tmp_path / 'ref' / 'data'))
+    assert os.listdir(str(tmp_path / 'box')) == ['out']
+    assert not os.path.lexists(str(tmp_path / 'escaped.jpg'))
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    archive = str(tmp_path / 'a.tar')
+    make_tar(archive, files(5))
+    index_dir = str(tmp_path / 'index')
+    TarIndex(archive, index_dir=index_dir).extract([('', str(tmp_path / 'first'))])
+    # same names, other offsets and sizes: the saved index no longer matches the stamp
+    make_tar(archive, [('new/first.jpg', b'0' * 700)] + files(5))
+    reference(archive, str(tmp_path / 'ref'))
+    index = TarIndex(archive, index_dir=index_dir)
+    assert 'new/first.jpg' in index.members
+    index.extract([('', str(tmp_path / 'out'))])
+    assert tree(str(tmp_path / 'out')) == tree(str(tmp_path / 'ref'))
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_workers_match_serial(tmp_path, workers):
+    archive = make_tar(str(tmp_path / 'a.tar'), files(60), symlinks=[('data/latest.jpg', '0/0000.jpg')])
+    reference(archive, str(tmp_path / 'ref'))
+    count = TarIndex(archive, index_dir=str(tmp_path / 'index')).extract([('', str(tmp_path / 'out'))], workers)
+    assert count == 61
+    assert tree(str(tmp_path / 'out')) == tree(str(tmp_path / 'ref'))
@@ -0,0 +1,126 @@
+# Import necessary libraries
+import os
+import struct
+import zipfile
+import pytest
+
+from synthetic import add_zip
+from archive_index import extract_zip
+from manifest import Manifest
+from Parser import Parser
+
+###########################################################
+##########     extract_zip against ZipFile       ##########
+###########################################################
+
+# extract_zip copies stored members straight from their local entry and
+# inflates the others through ZipFile; both must give what ZipFile.extract
+# gives, refuse data whose CRC does not match and, on a rerun, write nothing
+# that is already in place (on disk, or moved away and recorded in a manifest).
+# Sample: python -m pytest tests/test_zip_extract.py
+
+compressions = [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+
+
+def members(count, prefix='images/'):
+    return [('{0}{1}/{2:04d}.jpg'.format(prefix, i % 3, i), os.urandom(50 + i) + b'\0' * 200) for i in range(count)]
+
+
+def make_zip(path, entries, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, 'w', compression) as archive:
+        for name, data in entries:
+            add_zip(archive, name, data)
+    return path
+
+
+def jobs(archive, out):
+    with zipfile.ZipFile(archive) as _archive:
+        return [(name, os.path.join(out, name)) for name in _archive.namelist()]
+
+
+def tree(folder):
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(folder):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                entries[os.path.relpath(path, folder)] = f.read()
+    return entries
+
+
+def patch_bytes(path, offset, data):
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def central_crc_offset(path, name):
+    # CRC-32 field of the central directory entry of name (46 byte header, then the name)
+    with open(path, 'rb') as f:
+        data = f.read()
+    start = data.find(b'PK\x01\x02')
+    while start >= 0:
+        name_length = struct.unpack('<H', data[start + 28:start + 30])[0]
+        if data[start + 46:start + 46 + name_length] == name.encode('utf-8'):
+            return start + 16
+        start = data.find(b'PK\x01\x02', start + 1)
+    raise KeyError(name)
+
+
+@pytest.mark.parametrize('compression', compressions)
+@pytest.mark.parametrize('workers', [1, 3])
+def test_output_matches_zipfile(tmp_path, compression, workers):
+    archive = make_zip(str(tmp_path / 'a.zip'), members(30), compression)
+    with zipfile.ZipFile(archive) as _archive:
+        _archive.extractall(str(tmp_path / 'ref'))
+    assert extract_zip(archive, jobs(archive, str(tmp_path / 'out')), workers) == 30
+    assert tree(str(tmp_path / 'out')) == tree(str(tmp_path / 'ref'))
+
+
+def test_corrupt_stored_data_is_refused(tmp_path):
+    archive = make_zip(str(tmp_path / 'a.zip'), members(3))
+    with zipfile.ZipFile(archive) as _archive:
+        info = _archive.infolist()[1]
+    # first data byte: after the 30 byte local header, the name and the (empty) extra field
+    patch_bytes(archive, info.header_offset + 30 + len(info.filename), b'\xff\xfe')
+    with pytest.raises(zipfile.BadZipFile):
+        extract_zip(archive, jobs(archive, str(tmp_path / 'out')))
+
+
+@pytest.mark.parametrize('compression', compressions)
+def test_crc_mismatch_is_refused(tmp_path, compression):
+    archive = make_zip(str(tmp_path / 'a.zip'), members(3), compression)
+    patch_bytes(archive, central_crc_offset(archive, members(3)[2][0]), b'\0\0\0\0')
+    with pytest.raises(zipfile.BadZipFile):
+        extract_zip(archive, jobs(archive, str(tmp_path / 'out')))
+
+
+@pytest.mark.parametrize('compression', compressions)
+def test_rerun_writes_nothing(tmp_path, compression):
+    archive = make_zip(str(tmp_path / 'a.zip'), members(12), compression)
+    out = str(tmp_path / 'out')
+    assert extract_zip(archive, jobs(archive, out), 2) == 12
+    before = tree(out)
+    assert extract_zip(archive, jobs(archive, out), 2) == 0
+    assert tree(out) == before
+
+
+@pytest.mark.parametrize('compression', compressions)
+def test_rerun_with_manifest_skips_placed_members(tmp_path, compression):
+    archive = make_zip(str(tmp_path / 'a.zip'), members(12), compression)
+    out = str(tmp_path / 'out') + '/'
+    targets = [('images/', out)]
+    def run():
+        manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+        skip, done = Parser.placed_images(archive, targets, manifest)
+        try:
+            return extract_zip(archive, jobs(archive, out), 1, skip, done)
+        finally:
+            manifest.close()
+    assert run() == 12
+    # the converters then move every image flat into out, as copy does
+    for name, target in jobs(archive, out):
+        os.rename(target, os.path.join(out, os.path.basename(name)))
+    assert run() == 0
+    # nothing extracted again under images/, the moved images are all there
+    assert sorted(tree(out)) == sorted(os.path.basename(name) for name, data in members(12))
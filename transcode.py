@@ -0,0 +1,72 @@
+# Import necessary libraries
+import os
+import multiprocessing
+from manifest import file_hash
+
+###########################################################
+##########      Cached PNG to JPEG transcoding   ##########
+###########################################################
+
+# Re-encodes images (INRIA ships .png) to JPEG once and keeps the result in
+# a cache keyed by the sha1 of the source and the quality, so repeat exports
+# only hash the sources. Encoding runs on a process pool.
+# Sample:
+#   transcoder = Transcoder(quality=90)
+#   jpgs = transcoder.run(['datasets/INRIA/images/a.png'], workers=4)
+#   # {'datasets/INRIA/images/a.png': 'datasets/transcoded/<sha1>-q90.jpg'}
+
+default_cache_dir = 'datasets/transcoded/'
+# PIL's own default, which the exporter always used
+default_quality = 75
+
+
+class Transcoder(object):
+    """
+        Definition: JPEG encoder with an on-disk cache keyed by source hash.
+    """
+    def __init__(self, cache_dir=default_cache_dir, quality=default_quality):
+        self.cache_dir = cache_dir
+        self.quality = quality
+
+    def cache_path(self, digest):
+        return os.path.join(self.cache_dir, "{0}-q{1}.jpg".format(digest, self.quality))
+
+    def transcode(self, src):
+        """
+            Definition: Encodes src as JPEG unless an identical source was encoded before.
+            Returns: path of the cached JPEG
+        """
+        target = self.cache_path(file_hash(src))
+        if os.path.isfile(target):
+            return target
+        from PIL import Image
+        im = Image.open(src)
+        if im.mode not in ('RGB', 'L', 'CMYK'):
+            im = im.convert('RGB')
+        # write under a temporary name so an interrupted run never leaves a partial entry
+        tmp = "{0}.{1}.tmp".format(target, os.getpid())
+        im.save(tmp, "jpeg", quality=self.quality)
+        im.close()
+        os.replace(tmp, target)
+        return target
+
+    def run(self, sources, workers=1):
+        """
+            Definition: Transcodes all sources, in parallel when workers > 1.
+            Returns: dict of source path -> cached JPEG path
+        """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        if workers > 1 and len(sources) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                return dict(pool.imap_unordered(_transcode, [(self, src) for src in sources], chunksize=16))
+            finally:
+                pool.close()
+                pool.join()
+        return dict((src, self.transcode(src)) for src in sources)
+
+
+def _transcode(args):
+    transcoder, src = args
+    return src, transcoder.transcode(src)
@@ -7,16 +7,22 @@ Usage :
     visualisation_tool.py --ann_dir=''  --images_dir='' --index=''
  - .jpg images, annotations (Pascal VOC format)  
     visualisation_tool.py --ann_dir=''  --images_dir='' --index=''
+ - headless: annotated images (or --mosaic N contact sheets) written to a folder
+    visualisation_tool.py --ann_dir=''  --images_dir='' --index=-1 --output_dir='' [--mosaic 16]
 '''
-import cv2
-from PIL import Image
-import pandas as pd
-import json
 import os, glob
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 import argparse
-import xml.etree.cElementTree as etree
+import threading
+import multiprocessing
+import numpy as np
+from six.moves import queue
+from image_meta import SizeCache
+from ann_store import AnnotationStore
+from voc_xml import VocCache, read_voc
+from lazy import lazy_import
+# imported on first use, so the module can be imported as a library cheaply
+cv2 = lazy_import('cv2')
+plt = lazy_import('matplotlib.pyplot')
 
 
 
@@ -27,14 +33,35 @@ import xml.etree.cElementTree as etree
 ##########       VISUALISATION TOOLS FOR BOUNDING BOXES AND LABELS   #############
 #################################################################################
 
-ap = argparse.ArgumentParser()
-ap.add_argument("--images_dir", required = True, help = "Directory of images")
-ap.add_argument("--ann_dir", required = False, 
-                help = "Directory with annotations")
-ap.add_argument("--index", default='0',
-                required = True, help = "Label index in CSV file to display (-1 to show all)")
+def createParser():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images_dir", required = True, help = "Directory of images")
+    ap.add_argument("--ann_dir", required = False, 
+                    help = "Directory with annotations")
+    ap.add_argument("--index", default='0',
+                    required = True, help = "Label index in CSV file to display (-1 to show all), or an image file name")
+    ap.add_argument("--output_dir", required = False,
+                    help = "Write annotated images here instead of showing them (headless)")
+    ap.add_argument("--mosaic", type=int, default=0, required = False,
+                    help = "With --output_dir, tile this many thumbnails per contact sheet")
+    ap.add_argument("--thumb_size", type=int, default=256, required = False, help = "Mosaic tile size in pixels")
+    ap.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), required = False,
+                    help = "Processes rendering with --output_dir")
+    return ap
 
-args = vars(ap.parse_args())
+# per process caches, loaded from disk on first use so importing the module reads nothing:
+# image dimensions read from headers, and parsed VOC annotations per file path + mtime + size
+_caches = {}
+
+def sizes():
+    if 'sizes' not in _caches:
+        _caches['sizes'] = SizeCache()
+    return _caches['sizes']
+
+def voc_annotations():
+    if 'voc' not in _caches:
+        _caches['voc'] = VocCache()
+    return _caches['voc']
 
 def list_files(folder, file_format='.jpg'):
     """
@@ -64,6 +91,10 @@ def show_image(image):
             break
     cv2.destroyWindow('Image') 
 
+def line_thickness(filename):
+    w, h, channels = sizes().get(filename)
+    return 10 if w > 650 else 2
+
 def draw_rectangle(filename,image,rectangle, center_with_size=False, color=[0, 255, 0]):
     if center_with_size:
         cx, cy, w, h = rectangle
@@ -71,12 +102,7 @@ def draw_rectangle(filename,image,rectangle, center_with_size=False, color=[0, 2
         top, bottom = int(cy - h/2), int(cy + h/2)
     else:
         left, top, right, bottom = rectangle
-        img = Image.open(filename)
-        w, h = img.size
-        if w > 650:
-            k = 10
-        else:
-            k = 2
+    k = line_thickness(filename)
     return cv2.rectangle(image,(left,top),(right, bottom),color,int(k))
 
 def draw_bounding_box(filename,image, bound_box, center_with_size=True, color=(0,255,0)):
@@ -91,8 +117,105 @@ def load_image(filename, flags=-1):
         return None
     return cv2.imread(filename, flags)
 
-def show_bound_box(filename, bound_boxes, gender=None, age=None):
-    image = load_image(filename, cv2.IMREAD_COLOR)
+def label_text(gender, age):
+    return "{}, {}".format(int(age),"M" if float(gender)>0.5 else "NAN" if gender == "nan"  else "F")
+
+def annotate(filename, image, annotations):
+    """
+        Definition: Draws the boxes of every annotation onto image, with the gender
+                    and age written in the top left corner when present.
+        Returns: annotated image
+    """
+    for bound_boxes, gender, age in annotations:
+        for bound_box in bound_boxes:
+            image = draw_bounding_box(filename, image, bound_box, center_with_size=False)
+        if age != None:
+            scale = max(0.5, image.shape[1] / 640.0)
+            cv2.putText(image, label_text(gender, age), (5, int(25 * scale)), cv2.FONT_HERSHEY_SIMPLEX,
+                        scale, (0, 255, 0), max(1, int(2 * scale)))
+    return image
+
+def thumbnail(image, size):
+    """
+        Definition: Scales image to fit a size x size black tile, keeping the aspect ratio.
+    """
+    tile = np.zeros((size, size, 3), np.uint8)
+    if image is None:
+        return tile
+    h, w = image.shape[:2]
+    k = float(size) / max(w, h)
+    tw, th = max(1, int(w * k)), max(1, int(h * k))
+    y, x = (size - th) // 2, (size - tw) // 2
+    tile[y:y + th, x:x + tw] = cv2.resize(image, (tw, th), interpolation=cv2.INTER_AREA)
+    return tile
+
+# per process ImageIndex of the batch being rendered, keyed by its folders
+_indexes = {}
+
+def _render(task):
+    annotations_folder, images_folder, positions, output_dir, mosaic, thumb_size, sheet = task
+    key = (annotations_folder, images_folder)
+    if key not in _indexes:
+        _indexes[key] = ImageIndex(annotations_folder, images_folder)
+    image_index = _indexes[key]
+    tiles = []
+    rendered = 0
+    for i in positions:
+        filename, image, annotations = image_index.load(i)
+        if image is None:
+            continue
+        rendered += 1
+        image = annotate(filename, image, annotations)
+        if mosaic:
+            tile = thumbnail(image, thumb_size)
+            cv2.putText(tile, get_filename(filename), (3, thumb_size - 6), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.4, (255, 255, 255), 1)
+            tiles.append(tile)
+        else:
+            cv2.imwrite(os.path.join(output_dir, get_filename(filename) + ".jpg"), image)
+    if mosaic and tiles:
+        cols = int(np.ceil(np.sqrt(mosaic)))
+        rows = int(np.ceil(len(tiles) / float(cols)))
+        sheet_image = np.zeros((rows * thumb_size, cols * thumb_size, 3), np.uint8)
+        for n, tile in enumerate(tiles):
+            r, c = divmod(n, cols)
+            sheet_image[r * thumb_size:(r + 1) * thumb_size, c * thumb_size:(c + 1) * thumb_size] = tile
+        cv2.imwrite(os.path.join(output_dir, "sheet_{0:05d}.jpg".format(sheet)), sheet_image)
+    return rendered
+
+def render_batch(annotations_folder, images_folder, output_dir, index=-1, mosaic=0, thumb_size=256, workers=1):
+    """
+        Definition: Headless mode: writes annotated images (or contact sheets of mosaic
+                    thumbnails each) to output_dir instead of showing them, in parallel.
+        Returns: number of images rendered
+    """
+    if not AnnotationStore.exists(annotations_folder):
+        voc_annotations().update(annotations_folder)
+        # workers load the cache from disk
+        voc_annotations().save()
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    image_index = ImageIndex(annotations_folder, images_folder)
+    _indexes[(annotations_folder, images_folder)] = image_index
+    if index == -1:
+        positions = list(range(len(image_index)))
+    else:
+        positions = [index if isinstance(index, int) else image_index.find(index)]
+    per_task = mosaic or 32
+    tasks = [(annotations_folder, images_folder, positions[start:start + per_task], output_dir, mosaic, thumb_size, n)
+             for n, start in enumerate(range(0, len(positions), per_task))]
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            return sum(pool.imap_unordered(_render, tasks))
+        finally:
+            pool.close()
+            pool.join()
+    return sum(_render(task) for task in tasks)
+
+def show_bound_box(filename, bound_boxes, gender=None, age=None, image=None):
+    if image is None:
+        image = load_image(filename, cv2.IMREAD_COLOR)
     if image is None:
         return
     
@@ -109,7 +232,7 @@ def show_bound_box(filename, bound_boxes, gender=None, age=None):
     else:
         for bound_box in bound_boxes:
             result = draw_bounding_box(filename,image, bound_box, center_with_size=False)
-        plt.title("{}, {}".format(int(age),"M" if float(gender)>0.5 else "NAN" if gender == "nan"  else "F"))
+        plt.title(label_text(gender, age))
         plt.imshow(result)
         plt.show()
     
@@ -123,95 +246,154 @@ def parse_from_pascal_voc_format(filename):
             Bounding box: ints xmin, ymin, xmax, ymax - 
                           represents bounding box cornets coordinates
     """
-    bounding_boxes = []
-    bounding_box = []
-    gender = None
-    age = None
-    in_file = open(filename)
-    tree=etree.parse(in_file)
-    root = tree.getroot()
-    for obj in root.iter('object'):
-        current = list()              
-        xmlbox = obj.find('bndbox')
-        xn = int(float(xmlbox.find('xmin').text))
-        xx = int(float(xmlbox.find('xmax').text))
-        yn = int(float(xmlbox.find('ymin').text))
-        yx = int(float(xmlbox.find('ymax').text))
-        bounding_box = [xn,yn,xx,yx]
-        bounding_boxes.append( bounding_box)
-        if obj.find('gender') != None:
-            if obj.find('gender').text != "None":
-                gender = float(obj.find('gender').text)
-            else:
-                gender = "nan"
-            age = float(obj.find('age').text)
-    in_file.close()
+    bounding_boxes, gender, age = read_voc(filename)
     if gender != None:
         return (bounding_boxes,gender,age)
     else:
         #return (xn,yn,xx,yx)
         return(bounding_boxes)
     
-def parse_json_annotation(filename):
-        
+def parse_json_annotation(record):
+    """
+        Args:
+            record: image record from the dataset annotation store
+
+        Returns:
+            Bounding boxes, plus gender and age for IMDB-WIKI records
+    """
     bdn_bxs = []
     gender = None
     age = None
-    f= open(filename)
-    for line in f:
-        line = line.replace("'", '"')
-        line = line.replace("nan", 'null')
-        my_dict = json.loads(line)
-        for obj in my_dict["objects"]:
-            bdn_bxs.append(obj["bounding_box"])
-            if "gender" in obj:
-                if obj["gender"] != None:
-                    gender = float(obj["gender"])
-                else:
-                    gender = "nan"
-                age = float(obj["age"])
-                f.close()
-                return  (bdn_bxs, gender, age)
-    f.close()
+    for obj in record["objects"]:
+        bdn_bxs.append(obj["bounding_box"])
+        if "gender" in obj:
+            if obj["gender"] != None:
+                gender = float(obj["gender"])
+            else:
+                gender = "nan"
+            age = float(obj["age"])
+            return  (bdn_bxs, gender, age)
     return  bdn_bxs
    
-def process_single(annotations_folder, images_folder, index):
-    bounding_box = []
-    gender = None
-    age = None
-    if images_folder == "datasets/INRIA/images/":
-        images = sorted(list_files(images_folder, '.png'))
-    else:
-        images = sorted(list_files(images_folder, '.jpg'))
-    annotations_xml = sorted(list_files(annotations_folder, '.xml'))
-    annotations_json = sorted(list_files(annotations_folder, '.json'))
-    if annotations_xml != []:
-        annfile = annotations_folder+get_filename(images[index])+".xml"
-        if os.path.isfile(annfile) and os.path.isfile(images[index]):
-            if type(parse_from_pascal_voc_format(annfile)[-1]) != float:
-                bounding_box = parse_from_pascal_voc_format(annfile)
-            else:
-                bounding_box, gender, age = parse_from_pascal_voc_format(annfile)
-            show_bound_box(images[index], bounding_box, gender, age)
-    print(annotations_json )
-    if annotations_json != []:
-        annfile = annotations_folder+get_filename(images[index])+".json"
-        if os.path.isfile(annfile) and os.path.isfile(images[index]):
-            if type(parse_json_annotation( annfile)[-1]) != float:
-                bounding_box = parse_json_annotation( annfile)
-            else:
-                bounding_box, gender, age = parse_json_annotation( annfile)
-            show_bound_box(images[index], bounding_box, gender, age)
+class ImageIndex(object):
+    """
+        Definition: Images of a folder paired by file stem with their annotations
+                    (VOC .xml files or annotation store records), listed once.
+    """
+    def __init__(self, annotations_folder, images_folder):
+        if images_folder == "datasets/INRIA/images/":
+            images = sorted(list_files(images_folder, '.png'))
+        else:
+            images = sorted(list_files(images_folder, '.jpg'))
+        self.xml = dict((get_filename(f), f) for f in list_files(annotations_folder, '.xml'))
+        self.store = AnnotationStore(annotations_folder) if AnnotationStore.exists(annotations_folder) else None
+        self.images = [f for f in images if self.annotated(get_filename(f))]
+        self.positions = dict((get_filename(f), i) for i, f in enumerate(self.images))
+
+    def annotated(self, stem):
+        return stem in self.xml or (self.store is not None and stem+".jpg" in self.store)
+
+    def __len__(self):
+        return len(self.images)
+
+    def find(self, name):
+        """
+            Definition: Position of an image given its path, file name or stem.
+        """
+        return self.positions[get_filename(name)]
+
+    def load(self, i):
+        """
+            Returns: image path, decoded image and a list of (bounding boxes, gender, age)
+        """
+        filename = self.images[i]
+        stem = get_filename(filename)
+        annotations = []
+        if stem in self.xml:
+            annotations.append(voc_annotations().get(self.xml[stem]))
+        if self.store is not None:
+            record = self.store.get(stem+".jpg")
+            if record is not None:
+                parsed = parse_json_annotation(record)
+                if type(parsed[-1]) != float:
+                    annotations.append((parsed, None, None))
+                else:
+                    annotations.append(parsed)
+        return filename, load_image(filename, cv2.IMREAD_COLOR), annotations
+
+def prefetch(index, positions, depth=2):
+    """
+        Definition: Loads index items in a background thread, up to depth ahead of
+                    the one being shown.
+        Returns: generator of ImageIndex.load results
+    """
+    items = queue.Queue(depth)
+    stop = threading.Event()
+    done = object()
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    def worker():
+        try:
+            for i in positions:
+                if not put(index.load(i)):
+                    return
+        except Exception as e:
+            put(e)
+        put(done)
+    thread = threading.Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def show_item(filename, image, annotations):
+    for bounding_box, gender, age in annotations:
+        show_bound_box(filename, bounding_box, gender, age, image.copy() if image is not None else None)
+
+def process_single(annotations_folder, images_folder, index, image_index=None):
+    if image_index is None:
+        image_index = ImageIndex(annotations_folder, images_folder)
+    if not isinstance(index, int):
+        index = image_index.find(index)
+    show_item(*image_index.load(index))
             
 def _process_dir(annotations_folder, images_folder, index=-1):
-    filescount = len(os.listdir(annotations_folder))
+    if not AnnotationStore.exists(annotations_folder):
+        # parses only new or changed files; the rest comes from the cache
+        voc_annotations().update(annotations_folder)
+    # one listing for the whole browse; images and annotations are paired by stem
+    image_index = ImageIndex(annotations_folder, images_folder)
     if index == -1:
-        for i in range(filescount):
-            process_single(images_folder,annotations_folder, i)
+        for item in prefetch(image_index, range(len(image_index))):
+            show_item(*item)
     else:
-        process_single(images_folder,annotations_folder,  index)
+        process_single(annotations_folder, images_folder, index, image_index)
 
 def main():      
+    args = vars(createParser().parse_args())
+    try:
+        run(args)
+    finally:
+        # only the caches this run used
+        for cache in _caches.values():
+            cache.save()
+
+def run(args):
     
     if not args['ann_dir']: 
         print ("Please specify folder with annotations") 
@@ -219,10 +401,17 @@ def main():
         if not args['images_dir']:
             print ("Please specify images folder")  
         else:
-            index = int(args['index']) if args['index'] else 0  
+            index = args['index'] or '0'
+            # an image file name or stem seeks to that image
+            index = int(index) if index.lstrip('-').isdigit() else index
             if args['ann_dir'] and os.path.exists(args['ann_dir']):
                 print(args['images_dir'], args['ann_dir'], index)
-                _process_dir(args['ann_dir'], args['images_dir'], index)
+                if args['output_dir']:
+                    count = render_batch(args['ann_dir'], args['images_dir'], args['output_dir'], index,
+                                         args['mosaic'], args['thumb_size'], args['workers'])
+                    print("Rendered {0} images to {1}".format(count, args['output_dir']))
+                else:
+                    _process_dir(args['ann_dir'], args['images_dir'], index)
     #_process_dir("datasets/_VOC/train/annotations/", "datasets/_VOC/train/images/", -1)
     #_process_dir("datasets/JSON_INRIA/", "datasets/INRIA/images/", -1)
     #_process_dir("datasets/JSON_WIDER/", "datasets/WIDER/images/", -1)
@@ -0,0 +1,179 @@
+# Import necessary libraries
+import os, glob
+import pickle
+
+###########################################################
+##########      Templated Pascal VOC XML writer  ##########
+###########################################################
+
+# Writes the same bytes as JsonToPascalVoc.to_pasvoc_xml + lxml
+# ElementTree.write(pretty_print=True), but straight from the box values
+# with precompiled string templates instead of ~15 Elements per box.
+# Sample:
+#   data = voc_xml('datasets/JSON_AFW/afw_0001.jpg', labels, coords, w, h)
+#   open('afw_0001.xml', 'wb').write(data)
+#
+# The reader side, read_voc, keeps only the boxes, gender and age in a single
+# iterparse pass. VocCache stores what it read for whole annotation
+# directories in one pickle keyed by path, mtime and size.
+# Sample:
+#   voc = VocCache()
+#   voc.update('datasets/VOC/train/annotations/')
+#   boxes, gender, age = voc.get('datasets/VOC/train/annotations/afw_0001.xml')
+#   voc.save()
+
+default_cache_file = 'datasets/voc_annotations.pkl'
+
+HEAD = ("<annotation>\n"
+        "  <filename>%s</filename>\n"
+        "  <folder>%s</folder>\n")
+OBJECT_HEAD = ("  <object>\n"
+               "    <name>%s</name>\n")
+PERSON = ("    <gender>%s</gender>\n"
+          "    <age>%s</age>\n")
+OBJECT_TAIL = ("    <bndbox>\n"
+               "      <xmax>%s</xmax>\n"
+               "      <xmin>%s</xmin>\n"
+               "      <ymax>%s</ymax>\n"
+               "      <ymin>%s</ymin>\n"
+               "    </bndbox>\n"
+               "    <difficult>0</difficult>\n"
+               "    <occluded>0</occluded>\n"
+               "    <pose>Unspecified</pose>\n"
+               "    <truncated>1</truncated>\n"
+               "  </object>\n")
+TAIL = ("  <size>\n"
+        "    <depth>3</depth>\n"
+        "    <height>%s</height>\n"
+        "    <width>%s</width>\n"
+        "  </size>\n"
+        "</annotation>\n")
+
+
+def escape(text):
+    """
+        Definition: Escapes element text the way lxml serialises it.
+    """
+    text = str(text)
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    if '\r' in text:
+        text = text.replace('\r', '&#13;')
+    return text
+
+
+def voc_xml(fname, labels, coords, img_width, img_height, genders=None, ages=None):
+    """
+        Definition: Serialises one VOC annotation.
+        Returns: bytes identical to the lxml builder output (ASCII with character references)
+    """
+    f = fname.split("/")
+    parts = [HEAD % (escape(f[-1]), escape("/".join(f[:-1])))]
+    if hasattr(coords, 'tolist'):
+        coords = coords.tolist()
+    with_person = genders is not None and len(genders) > 0
+    for i in range(len(coords)):
+        parts.append(OBJECT_HEAD % escape(labels[i]))
+        if with_person:
+            parts.append(PERSON % (escape(genders[i]), escape(ages[i])))
+        box = coords[i]
+        parts.append(OBJECT_TAIL % (box[2], box[0], box[3], box[1]))
+    parts.append(TAIL % (img_height, img_width))
+    return "".join(parts).encode('ascii', 'xmlcharrefreplace')
+
+
+BOX_FIELDS = ('xmin', 'ymin', 'xmax', 'ymax')
+
+
+def read_voc(source):
+    """
+        Definition: Reads boxes and person attributes of a Pascal VOC file in one
+                    iterparse pass, without building the element tree.
+        Returns: (boxes as [xmin, ymin, xmax, ymax] ints, gender, age); gender is a
+                 float, "nan" for unknown and None with age when the file has none
+    """
+    # only the reader side parses XML
+    from xml.etree import ElementTree
+    boxes = []
+    box = {}
+    gender = None
+    age = None
+    for event, elem in ElementTree.iterparse(source):
+        tag = elem.tag
+        if tag in BOX_FIELDS:
+            box[tag] = int(float(elem.text))
+        elif tag == 'bndbox':
+            boxes.append([box[name] for name in BOX_FIELDS])
+            box = {}
+        elif tag == 'gender':
+            gender = float(elem.text) if elem.text != "None" else "nan"
+        elif tag == 'age':
+            age = float(elem.text)
+        elif tag == 'object':
+            elem.clear()
+    return boxes, gender, age
+
+
+class VocCache(object):
+    """
+        Definition: Persistent cache of parsed VOC annotations keyed by path + mtime + size.
+    """
+    def __init__(self, cache_file=default_cache_file):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.changed = False
+        if cache_file and os.path.isfile(cache_file):
+            with open(cache_file, 'rb') as f:
+                try:
+                    self.entries = pickle.load(f)
+                except Exception:
+                    # unreadable or from an incompatible version: rebuild
+                    self.entries = {}
+
+    def get(self, filename):
+        """
+            Definition: Parsed annotation, read from the cache while the file is unchanged.
+            Returns: (boxes, gender, age) as read_voc
+        """
+        st = os.stat(filename)
+        key = os.path.abspath(filename)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        parsed = read_voc(filename)
+        self.entries[key] = (st.st_mtime_ns, st.st_size, parsed)
+        self.changed = True
+        return parsed
+
+    def update(self, folder):
+        """
+            Definition: Brings the cache up to date for every .xml file in folder and
+                        drops entries of files that were deleted from it.
+            Returns: number of annotation files in folder
+        """
+        filenames = glob.glob(os.path.join(folder, '*.xml'))
+        for filename in filenames:
+            self.get(filename)
+        present = set(os.path.abspath(filename) for filename in filenames)
+        folder = os.path.abspath(folder)
+        stale = [key for key in self.entries if os.path.dirname(key) == folder and key not in present]
+        for key in stale:
+            del self.entries[key]
+        self.changed = self.changed or bool(stale)
+        return len(filenames)
+
+    def save(self):
+        if not self.changed or not self.cache_file:
+            return
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp = self.cache_file + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.cache_file)
+        self.changed = False
@@ -1,7 +1,6 @@
 # Import necessary libraries
 import os, sys, shutil, glob, argparse
 import numpy as np
-import random
 from Parser import *
 
 python_version = sys.version_info.major
@@ -18,119 +17,94 @@ python_version = sys.version_info.major
                                   #-- anns_subfolder wider_face_split/
 # By defoult subfolder path for images: "WIDER_train/images/"
 #for annotations extraction: "subfolder wider_face_split/"
+# The ground truth file is parsed in a single pass, without per-image files.
+# Add --stream to read it straight from the archive and write images
+# without intermediate folders.
 
 imgs_dataset_archive = "WIDER_train.zip"
 anns_dataset_archive = "wider_face_split.zip"
 anns_subfolder = "wider_face_split"
 imgs_subfolder = "WIDER_train/images/"
-subdir_count = 62
-subdir = []
-#for shuffle
-names = random.sample(range(1,100000), 100000-1)
+gt_filename = 'wider_face_train_bbx_gt.txt'
 dir_imgs_will_be_extracted_to = 'datasets/WIDER/images/'
 dir_anns_will_be_extracted_to = 'datasets/WIDER/annotations/'
-divide_ann_folder = 'datasets/WIDER/divide_ann/'
 json_dir = 'datasets/JSON_WIDER/'
-directories = [dir_imgs_will_be_extracted_to, dir_anns_will_be_extracted_to, divide_ann_folder, json_dir ]
+directories = [dir_imgs_will_be_extracted_to, dir_anns_will_be_extracted_to, json_dir ]
+# per-face flags following x1 y1 w h in the ground truth file; WIDER's typical/atypical
+# pose flag is kept as atypical_pose so it does not clash with AFW yaw/pitch/roll poses
+attribute_names = ('blur', 'expression', 'illumination', 'invalid', 'occlusion', 'atypical_pose')
 
+@register('WIDER')
 class WiderToJson(Parser):
+
+    root = 'datasets/WIDER/'
+    images_dir = dir_imgs_will_be_extracted_to
+    json_dir = json_dir
+    directories = directories
+    subfolders = (imgs_subfolder, anns_subfolder, None)
     
-    def make_divide_ann(self):
+    def parse(self, source=None):
         """
-        Definition: Populate divide_ann with separate ann files.
-        Returns: None
+        Definition: Reads wider_face_train_bbx_gt.txt once, straight from the extracted file
+        or from any iterable of lines (source), keeping the per-face attributes.
+        Returns: generator of image records
         """
-        filename = os.path.join(dir_anns_will_be_extracted_to+ 'wider_face_train_bbx_gt.txt') 
-        file = open(filename)
-        # Iterate through wider annotation data
-        for line in file:
-            if line[-5:-1] == ".jpg":
-                f= open(divide_ann_folder + line.split("/")[1].split(".jpg")[0]+'.txt',"w+")
-            if line[-5:-1] != ".jpg":
-                l = line.split(" ")
-                if len(l) < 2:
-                    file_lines_count =int(line.split("/")[0])
-                if len(l) > 2:
-                    f.write(line)
-        file.close()
-    def parse(self):
+        if source is None:
+            with open(os.path.join(dir_anns_will_be_extracted_to, anns_subfolder, gt_filename)) as gt:
+                for record in self.parse(gt):
+                    yield record
+            return
+        lines = iter(source)
+        for line in lines:
+            line = line.strip()
+            if not line.endswith(".jpg"):
+                continue
+            object_info = {'filename': line.split("/")[-1], 'objects': []}
+            count = int(next(lines))
+            # images without faces still carry a single all-zero row
+            for i in range(max(count, 1)):
+                values = [int(v) for v in next(lines).split()]
+                if i >= count:
+                    continue
+                x1, y1 = values[0], values[1]
+                x2, y2 = x1 + values[2], y1 + values[3]
+                person_info = {'class_name':'Person', 'bounding_box': [x1, y1, x2, y2]}
+                person_info.update(zip(attribute_names, values[4:]))
+                object_info['objects'].append(person_info)
+            yield object_info
+
+    def single_folder(self, root, placement=default_strategy):
         """
-        Definition: Parses divide_ann file to extract bounding boxcoordintates.
+        Definition: Moves images of every event folder under root into the images folder,
+        keeping their original (unique) names.
         """
-        objects = []   
-        object_info = {}
-        for f in os.listdir(divide_ann_folder):
-            lfile = open(divide_ann_folder+f)
-            object_info['filename'] = f.split(".")[0]+".jpg"
-            object_info['objects'] = []
-            coords = []
-            coor = []
-            # Load object bounding boxes.
-            for line in lfile:
-                coor = line.split(" ")[0:4]
-                x1 = int(coor[0])
-                y1 = int(coor[1])
-                x2 = int(coor[0])+int(coor[2])
-                y2 = int(coor[1])+int(coor[3])
+        # on a resumed run every image may already be in place, leaving nothing extracted
+        if not os.path.exists(dir_imgs_will_be_extracted_to + root):
+            return
+        for event in sorted(os.listdir(dir_imgs_will_be_extracted_to + root)):
+            self.copy(root + event + "/", dir_imgs_will_be_extracted_to, placement=placement)
+        shutil.rmtree(dir_imgs_will_be_extracted_to + root.split("/")[0])
 
-                tmp = [x1,y1,x2,y2]
-                coords.append(tmp)
-                person_info = {'class_name':'Person'}
-                person_info ['bounding_box'] = tmp
-                object_info['objects'].append(person_info)
-                objects.append(object_info.copy())
-                tmp = []
-        return objects
-    
-    def rename(self,before,filename,ext,names,root_list,is_list = False):
-        if is_list == True:
-            for old_name in os.listdir(root_list):
-                new_name = old_name.split("--")[0]
-                os.rename(os.path.join(root_list, old_name),os.path.join(root_list, new_name))
-        else:
-            new_filename = before + "{0:0>5}".format(names[index])+ext
-            if ext == ".txt":
-                 # rename annotations at divide ann folder
-                if os.path.isfile(before+filename.split("\\")[1].split(".jpg")[0]+ext):
-                    os.rename(before+filename.split("\\")[1].split(".jpg")[0]+ext, new_filename)
-            if ext == ".jpg":
-                # rename images
-                os.rename(filename, new_filename)
-            return new_filename
-    
-    def copy(self, subfolder, dir_path, names=None):
-        Parser.copy(subfolder, dir_path, names=None)
-        for filename in glob.glob(os.path.join( dir_path + subfolder, "*.*")):
-            # rename annotations each in divide_ann folder according to images names
-            self.rename(dir_anns_will_be_extracted_to,filename, ".txt",names, None)
-            # rename & copy images to one single folder
-            shutil.copy(self.rename(dir_path+subfolder,filename, ".jpg",names, None) ,  dir_path)
-            #remover folders with images after copies into single folder
-            if os.path.exists(dir_path+"WIDER_train"+subfolder):
-                shutil.rmtree( dir_path+"WIDER_train"+subfolder)
-    def single_folder(self):
-        for i in range(subdir_count):
-            subdir.append( imgs_subfolder+str(i)+"/")
-            self.copy(subdir[i], dir_imgs_will_be_extracted_to, names)
-        shutil.rmtree( dir_imgs_will_be_extracted_to+"WIDER_train")
+    def fetch(self, namespace, manifest):
+        """
+        Definition: Puts the images in a single folder (streamed or extracted) and finds the ground truth.
+        Returns: (ground truth key, its stamp, callable returning the record generator)
+        """
+        if namespace.stream:
+            self.stream_extract(imgs_dataset_archive, namespace.imgs_subfolder, dir_imgs_will_be_extracted_to, ann_exts=(), manifest=manifest)
+            anns = self.stream_extract(anns_dataset_archive, None, None, namespace.anns_subfolder, ann_exts=('.txt',))
+            data = anns[gt_filename]
+            return gt_filename, {'sha1': data_hash(data)}, lambda: self.parse(data.decode("utf-8").splitlines())
+        #extract images from wider dataset archive
+        self.extract(imgs_dataset_archive, namespace.imgs_subfolder, dir_imgs_will_be_extracted_to, namespace.extract_workers, manifest)
+        # extract annotations file from annotations dataset archive
+        self.extract(anns_dataset_archive, namespace.anns_subfolder, dir_anns_will_be_extracted_to)
+        #Copy images to single folder
+        self.single_folder(namespace.imgs_subfolder, namespace.placement)
+        gt = os.path.join(dir_anns_will_be_extracted_to, namespace.anns_subfolder, gt_filename)
+        return gt_filename, file_stamp(gt, True), self.parse
 
 def main():
-    namespace = Parser.createParser (imgs_subfolder, anns_subfolder, None)
-    wider =  WiderToJson()
-    #make wider directories
-    wider.make_directories(directories)
-    #extract images from wider dataset archive
-    wider.extract(imgs_dataset_archive, namespace.imgs_subfolder, dir_imgs_will_be_extracted_to)
-    # extract annotations file from annotations dataset archive
-    wider.extract(anns_dataset_archive, namespace.anns_subfolder, dir_anns_will_be_extracted_to)
-    #copy annotations into annotations folder
-    wider.copy(namespace.anns_subfolder, dir_anns_will_be_extracted_to)
-    wider.make_divide_ann()
-    #rename imgs subfolders to format "1"-"61"
-    wider.rename(None,None,None,None,dir_imgs_will_be_extracted_to+namespace.imgs_subfolder,True)
-    #Copy images to single folder
-    wider.single_folder()
-    # make json directory
-    wider.populate_json_ann(json_dir, wider.parse())
+    WiderToJson.to_json()
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()